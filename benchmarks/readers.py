@@ -0,0 +1,116 @@
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import readers
+
+# Benchmark of loading all input files with pd.read_csv and the Arrow reader
+# Run from the repository root: python -m benchmarks.readers
+
+
+def scale_inputs(folder, scale):
+    """
+    Write the input files with their rows repeated `scale` times.
+    """
+    for path, _ in readers.SCHEMAS.values():
+        with open(path, "rb") as f:
+            header = f.readline()
+            body = f.read()
+
+        if body and not body.endswith(b"\n"):
+            body += b"\n"
+
+        with open(os.path.join(folder, os.path.basename(path)), "wb") as f:
+            f.write(header + body * scale)
+
+
+def read_pandas(folder):
+    """
+    Load all inputs as before: pd.read_csv one file after the other, then
+    normalise column names.
+    """
+    frames = {}
+
+    for name, (path, _) in readers.SCHEMAS.items():
+        frame = pd.read_csv(os.path.join(folder, os.path.basename(path)))
+        frame.columns = frame.columns.str.lower()
+        frame.columns = frame.columns.str.replace("-", "_")
+        frames[name] = frame
+
+    return frames
+
+
+def read_arrow(folder):
+    """
+    Load all inputs with the Arrow reader, one file after the other.
+    """
+    return readers.read_all(workers=1, folder=folder)
+
+
+def read_arrow_concurrent(folder, workers=None):
+    return readers.read_all(workers=workers, folder=folder)
+
+
+def run_benchmark(scales=(1, 10, 100), workers=None, repeats=3):
+    results = []
+
+    variants = {
+        "pandas": read_pandas,
+        "arrow": read_arrow,
+        "arrow_concurrent": lambda folder: read_arrow_concurrent(folder, workers),
+    }
+
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as folder:
+            scale_inputs(folder, scale)
+
+            size = sum(entry.stat().st_size for entry in os.scandir(folder))
+
+            for variant, load in variants.items():
+                times = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    frames = load(folder)
+                    times.append(time.perf_counter() - start)
+
+                results.append(
+                    {
+                        "scale": scale,
+                        "rows": sum(len(frame) for frame in frames.values()),
+                        "megabytes": size / 1e6,
+                        "variant": variant,
+                        "load_time": min(times),
+                    }
+                )
+
+                print(results[-1])
+
+    results = pd.DataFrame(results)
+
+    # speed up relative to pd.read_csv
+
+    baseline = results[results["variant"] == "pandas"].set_index("scale")
+    results["speedup"] = (
+        results["scale"].map(baseline["load_time"]) / results["load_time"]
+    )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loading the input files")
+    parser.add_argument("--workers", type=int, default=None, help="number of threads")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run_benchmark(workers=args.workers, repeats=args.repeats)
+
+    print("\n\nReader benchmark")
+    print("=====================================")
+    print(results)
+
+    os.makedirs("outputs/benchmarks", exist_ok=True)
+    results.to_csv("outputs/benchmarks/readers.csv", index=False)
@@ -0,0 +1,148 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+from fitting import fit_stan, stan_model
+
+# Benchmark of the serial and reduce_sum versions of the ordered beta model
+# Run from the repository root: python -m benchmarks.stan_likelihood
+
+N_BASE = 400  # roughly the number of individuals in the behaviour models
+K = 20  # population-level effects, including the intercept
+N_GROUPS = 10  # deployments
+
+
+def simulate_standata(scale, seed=1):
+    """
+    Simulate Stan data for the ordered beta model at `scale` times the size
+    of the field data.
+    """
+    rng = np.random.default_rng(seed)
+
+    N = N_BASE * scale
+
+    X = np.column_stack([np.ones(N), rng.normal(size=(N, K - 1))])
+    J = rng.integers(1, N_GROUPS + 1, size=N)
+
+    b = rng.normal(0, 0.3, size=K)
+    r = rng.normal(0, 0.5, size=N_GROUPS)
+    mu = X @ b + r[J - 1]
+
+    # ordered beta outcome with zero/one inflation
+
+    cutzero, cutone = -2.0, 4.0
+    p_zero = 1 - expit(mu - cutzero)
+    p_one = expit(mu - cutone)
+
+    u = rng.uniform(size=N)
+    phi = 5
+    Y = rng.beta(expit(mu) * phi, (1 - expit(mu)) * phi)
+    Y[u < p_zero] = 0
+    Y[u > 1 - p_one] = 1
+
+    return {
+        "N": N,
+        "Y": Y,
+        "K": K,
+        "X": X,
+        "Kc": K - 1,
+        "N_1": N_GROUPS,
+        "M_1": 1,
+        "J_1": J,
+        "Z_1_1": np.ones(N),
+        "prior_only": 0,
+    }
+
+
+def gradient_time(fit):
+    """
+    Read the gradient evaluation time CmdStan reports before sampling.
+    """
+    times = []
+
+    for path in fit.runset.stdout_files:
+        with open(path) as f:
+            match = re.search(r"Gradient evaluation took ([\d.e-]+) seconds", f.read())
+
+        if match:
+            times.append(float(match.group(1)))
+
+    return np.mean(times) if times else np.nan
+
+
+def run_benchmark(scales=(1, 10, 100), threads=4, iterations=200):
+    results = []
+
+    variants = {"serial": 1, "threaded": threads}
+
+    # compile once, outside the timed sampling runs
+
+    models, compile_times = {}, {}
+
+    for variant, n_threads in variants.items():
+        start = time.perf_counter()
+        models[variant] = stan_model(threaded=n_threads > 1)
+        compile_times[variant] = time.perf_counter() - start
+
+    for scale in scales:
+        data = simulate_standata(scale)
+
+        for variant, n_threads in variants.items():
+            start = time.perf_counter()
+
+            fit = fit_stan(
+                data,
+                threads=n_threads,
+                chains=1,
+                model=models[variant],
+                iter_warmup=iterations,
+                iter_sampling=iterations,
+                seed=1,
+                show_progress=False,
+            )
+
+            results.append(
+                {
+                    "scale": scale,
+                    "N": data["N"],
+                    "variant": variant,
+                    "threads": n_threads,
+                    "gradient_time": gradient_time(fit),
+                    "wall_time": time.perf_counter() - start,
+                    "compile_time": compile_times[variant],
+                }
+            )
+
+            print(results[-1])
+
+    results = pd.DataFrame(results)
+
+    # speed up of the threaded model relative to the serial one
+
+    serial = results[results["variant"] == "serial"].set_index("scale")
+    results["speedup"] = (
+        results["scale"].map(serial["wall_time"]) / results["wall_time"]
+    )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the threaded likelihood")
+    parser.add_argument("--threads", type=int, default=4, help="threads per chain")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = run_benchmark(threads=args.threads, iterations=args.iterations)
+
+    print("\n\nLikelihood benchmark")
+    print("=====================================")
+    print(results)
+
+    os.makedirs("outputs/benchmarks", exist_ok=True)
+    results.to_csv("outputs/benchmarks/stan_likelihood.csv", index=False)
@@ -1,25 +1,46 @@
 import pandas as pd
 import numpy as np
+import argparse
+import hashlib
 import os
+from scipy.spatial import cKDTree
+
+import readers
+import shared
+from cube import Cube
+from taxonomy import Taxonomy
 
 # Clean individual level data
 
 os.makedirs("outputs/data", exist_ok=True)
 
 
-def clean_individuals():
+def read_individuals():
+    """
+    Read individual level data with normalised column names
+    """
+    return readers.read("individuals")
+
+
+def clean_individuals(individuals=None, taxonomy=None):
     """
-    Clean individual level data
+    Clean individual level data, read from data/individuals.csv by default.
+    Species names are resolved against the taxonomy, if given, before the
+    conspecific counts, keeping unmatched names.
     """
-    individuals = pd.read_csv("data/individuals.csv")
-    individuals.columns = individuals.columns.str.lower()
-    individuals.columns = individuals.columns.str.replace("-", "_")
+    if individuals is None:
+        individuals = read_individuals()
+
+    individuals = individuals.copy()
+
+    if taxonomy is not None:
+        resolved = taxonomy.resolve(individuals["species"])
+        individuals["species"] = resolved.fillna(individuals["species"])
 
     individuals["group"] = pd.Categorical(
         individuals["group"], categories=["no", "yes"], ordered=True
     )
     individuals["group"] = individuals["group"].cat.codes
-    individuals.loc[individuals["group"] < 0, "group"] = 0
 
     # calculate observed duration
 
@@ -27,6 +48,167 @@ def clean_individuals():
         float
     ) - individuals["time_in"].astype(float)
 
+    # parse bounding boxes "x_min, y_min, x_max, y_max" (pixels); anything
+    # else, including missing coordinates, gives a missing box
+
+    number = r"\s*(-?\d+(?:\.\d+)?)\s*"
+    boxes = (
+        individuals["coordinates"]
+        .astype("string")
+        .str.extract("^" + ",".join([number] * 4) + "$")
+    )
+    individuals[["x_min", "y_min", "x_max", "y_max"]] = boxes.astype(float).to_numpy()
+
+    individuals = spatial_features(individuals)
+    individuals = copresence(individuals)
+
+    return individuals
+
+
+# spatial covariates from bounding boxes
+
+FRAME_SIZE = (3840, 2160)  # video frame width and height (pixels)
+RADIUS = 500  # neighbourhood radius (pixels)
+
+SPATIAL = ["nn_distance", "n_neighbours", "centre_distance"]
+
+
+def spatial_features(individuals, radius=RADIUS, frame_size=FRAME_SIZE):
+    """
+    Spatial covariates of each individual from its bounding box centre.
+
+    Nearest neighbour distance and the number of neighbours within `radius`
+    are found with a KD-tree of the individuals in the same video file.
+    Distance to the frame centre, where the predator model sits, is in
+    pixels. All three are missing for individuals without a bounding box.
+    """
+    x = ((individuals["x_min"] + individuals["x_max"]) / 2).to_numpy()
+    y = ((individuals["y_min"] + individuals["y_max"]) / 2).to_numpy()
+    points = np.column_stack([x, y])
+
+    nn_distance = np.full(len(individuals), np.nan)
+    n_neighbours = np.full(len(individuals), np.nan)
+
+    valid = np.flatnonzero(~np.isnan(points).any(axis=1))
+
+    for index in individuals.iloc[valid].groupby("file").indices.values():
+        rows = valid[index]
+        tree = cKDTree(points[rows])
+
+        if len(rows) > 1:
+            distance, _ = tree.query(points[rows], k=2)
+            nn_distance[rows] = distance[:, 1]
+
+        n_neighbours[rows] = (
+            tree.query_ball_point(points[rows], radius, return_length=True) - 1
+        )
+
+    individuals["nn_distance"] = nn_distance
+    individuals["n_neighbours"] = pd.array(n_neighbours, dtype="Int64")
+    individuals["centre_distance"] = np.hypot(
+        x - frame_size[0] / 2, y - frame_size[1] / 2
+    )
+
+    return individuals
+
+
+# co-presence of individuals in video time
+
+COPRESENCE = ["n_copresent", "n_conspecifics", "sample_copresence"]
+
+
+class TimeIntervals:
+    """
+    Index of closed time intervals grouped by key (e.g. video file).
+
+    Start and end points are kept sorted within each key, with keys laid out
+    one after the other, so counting the intervals that overlap a query is
+    two binary searches, O(log n), for any number of queries at once.
+    Intervals with end < start are left out.
+    """
+
+    def __init__(self, keys, start, end):
+        start = np.asarray(start, dtype=float)
+        end = np.asarray(end, dtype=float)
+        valid = end >= start
+
+        self.keys = pd.Index(pd.unique(np.asarray(keys)[valid]))
+        code = self.keys.get_indexer(np.asarray(keys)[valid])
+
+        # offset keys so that one sorted array covers all of them
+        self.span = 2 * (
+            np.abs(np.concatenate([start[valid], end[valid], [0]])).max() + 1
+        )
+
+        self.start = start[valid] + code * self.span
+        self.end = end[valid] + code * self.span
+
+        self.by_start = np.sort(self.start)
+        self.sorted_end = np.sort(self.end)
+
+    def offset(self, keys, start, end):
+        code = self.keys.get_indexer(np.asarray(keys)).astype(float)
+        code[code < 0] = np.nan  # unknown key
+
+        return np.asarray(start, dtype=float) + code * self.span, np.asarray(
+            end, dtype=float
+        ) + code * self.span
+
+    def count(self, keys, start, end):
+        """
+        Number of intervals overlapping each query interval, NaN for unknown
+        keys and empty queries.
+        """
+        start, end = self.offset(keys, start, end)
+
+        n = np.searchsorted(self.by_start, end, side="right") - np.searchsorted(
+            self.sorted_end, start, side="left"
+        )
+
+        return np.where(np.isnan(start + end) | (end < start), np.nan, n)
+
+    def peak(self):
+        """
+        Largest number of simultaneous intervals per key, by a sweep over the
+        sorted endpoints.
+        """
+        times = np.concatenate([self.start, self.end])
+        step = np.concatenate([np.ones(len(self.start)), -np.ones(len(self.end))])
+
+        # starts before ends at equal times, as intervals are closed
+        order = np.lexsort((-step, times))
+        running = np.cumsum(step[order])
+
+        key = np.floor(times[order] / self.span + 0.5).astype(int)
+
+        return pd.Series(running).groupby(self.keys[key]).max()
+
+
+def copresence(individuals):
+    """
+    Co-presence counts from the time each individual was in frame.
+
+    n_copresent and n_conspecifics count the other individuals (of the same
+    species) in the same video file whose time in frame overlaps, and
+    sample_copresence is the largest number of individuals in frame at once
+    during the sample.
+    """
+    file = individuals["file"].fillna("")
+    species = file + "|" + individuals["species"].fillna("")
+    sample_id = individuals["ind_id"].str.rsplit("_", n=1).str[0]
+
+    start, end = individuals["time_in"], individuals["time_out"]
+    in_frame = (end >= start).to_numpy()
+
+    n_copresent = TimeIntervals(file, start, end).count(file, start, end)
+    n_conspecifics = TimeIntervals(species, start, end).count(species, start, end)
+
+    individuals["n_copresent"] = np.where(in_frame, n_copresent - 1, np.nan)
+    individuals["n_conspecifics"] = np.where(in_frame, n_conspecifics - 1, np.nan)
+    individuals["sample_copresence"] = sample_id.map(
+        TimeIntervals(sample_id, start, end).peak()
+    )
+
     return individuals
 
 
@@ -37,10 +219,7 @@ def clean_observations():
     """
     Clean observations data
     """
-    observations = pd.read_csv("data/observations.csv")
-    observations.columns = observations.columns.str.lower()
-    observations.columns = observations.columns.str.replace("-", "_")
-
+    observations = readers.read("observations")
     observations.rename(columns={"individual": "ind_id"}, inplace=True)
 
     return observations
@@ -48,10 +227,7 @@ def clean_observations():
 
 # Clean predators data
 def clean_predators():
-    predators = pd.read_csv("data/predators.csv")
-    predators.columns = predators.columns.str.lower()
-    predators.columns = predators.columns.str.replace("-", "_")
-
+    predators = readers.read("predators")
     predators.rename(columns={"index": "predator_id"}, inplace=True)
 
     return predators
@@ -64,18 +240,13 @@ def clean_sites():
     """
     Clean sites data
     """
-    sites = pd.read_csv("data/sites.csv")
-    sites.rename(columns={"index": "deployment_id"}, inplace=True)
-
-    # clean columns
-    sites.columns = sites.columns.str.lower()
-    sites.columns = sites.columns.str.replace("-", "_")
+    sites = readers.read("sites")
 
     return sites
 
 
 def clean_plots():
-    plots = pd.read_csv("data/plots.csv")
+    plots = readers.read("plots")
 
     plots.rename(columns={"index": "plot_id"}, inplace=True)
     return plots
@@ -88,7 +259,7 @@ def clean_samples():
     """
     Clean samples data
     """
-    samples = pd.read_csv("data/samples.csv")
+    samples = readers.read("samples")
     samples.rename(columns={"plot": "plot_id", "sample": "sample_id"}, inplace=True)
 
     return samples
@@ -96,7 +267,7 @@ def clean_samples():
 
 # Clean benthic cover data
 def clean_benthic_cover():
-    benthic_cover = pd.read_csv("data/benthic-cover.csv")
+    benthic_cover = readers.read("benthic_cover")
     benthic_cover["name"] = benthic_cover["name"].str.replace(".png", "")
     benthic_cover["name"] = benthic_cover["name"].str.replace(r"_Q\d_", "_", regex=True)
 
@@ -164,9 +335,7 @@ def clean_rugosity():
     """
     Clean rugosity data
     """
-    rugosity = pd.read_csv("data/rugosity.csv")
-    rugosity.columns = rugosity.columns.str.lower()
-    rugosity.columns = rugosity.columns.str.replace("-", "_")
+    rugosity = readers.read("rugosity")
 
     rugosity["treatment"] = rugosity["treatment"].str.lower().str.replace(" ", "-")
 
@@ -211,12 +380,145 @@ def clean_rugosity():
 def metadata():
     ## metadata
 
-    behaviours = pd.read_csv("data/behaviours.csv")
+    behaviours = readers.read("behaviours")
     #    sizes = pd.read_csv("data/sizes.csv")
 
     return behaviours
 
 
+## Validation
+
+
+def violations(table, checks, ids):
+    """
+    Summarise boolean violation masks of a table.
+
+    Args:
+        table (str): Table name.
+        checks (dict): Check description -> boolean mask over rows.
+        ids (pd.Series): Row identifiers shown as examples.
+
+    Returns:
+        pd.DataFrame: One row per check with the number of violating rows
+        and up to three examples.
+    """
+    # missing comparisons (e.g. with missing strings) are not violations
+    masks = pd.DataFrame(checks, index=ids.index).fillna(False).astype(bool)
+    counts = masks.sum()
+
+    examples = [
+        ", ".join(ids[masks[check]].astype(str).drop_duplicates().head(3))
+        for check in masks.columns
+    ]
+
+    return pd.DataFrame(
+        {
+            "table": table,
+            "check": masks.columns,
+            "violations": counts.to_numpy(),
+            "examples": examples,
+        }
+    )
+
+
+def validate(individuals, observations, samples, behaviours):
+    """
+    Check the loaded tables for known data problems before any fixes are
+    applied downstream, and write a violation report to
+    outputs/data/validation.csv.
+    """
+    # individuals
+
+    sample_id = individuals["ind_id"].str.rsplit("_", n=1).str[0]
+
+    report = [
+        violations(
+            "individuals",
+            {
+                "duplicate ind_id": individuals["ind_id"].duplicated(keep=False),
+                "group not yes/no": individuals["group"] < 0,
+                "time_out before time_in": individuals["observed_duration"] < 0,
+                "missing coordinates": individuals[["x_min", "y_min", "x_max", "y_max"]]
+                .isna()
+                .any(axis=1),
+                "sample not in samples": ~sample_id.isin(samples["sample_id"]),
+            },
+            individuals["ind_id"],
+        )
+    ]
+
+    # observations, against the individual's time in frame
+
+    times = individuals.drop_duplicates("ind_id").set_index("ind_id")
+    time_in = observations["ind_id"].map(times["time_in"])
+    time_out = observations["ind_id"].map(times["time_out"])
+    behaviour_type = observations["behaviour"].map(behaviours.set_index("name")["type"])
+
+    # State bouts span their first to last observation, as in calculate_duration
+
+    state = behaviour_type == "State"
+    bouts = (
+        observations[state].groupby(["ind_id", "behaviour"])["time"].agg(["min", "max"])
+    )
+    span = bouts["max"] - bouts["min"]
+    state_time = span.groupby(level="ind_id").sum()
+
+    bout = pd.MultiIndex.from_frame(observations[["ind_id", "behaviour"]])
+    single = state & (span.reindex(bout).to_numpy() == 0)
+    too_long = state & (observations["ind_id"].map(state_time) > time_out - time_in)
+
+    report.append(
+        violations(
+            "observations",
+            {
+                "ind_id not in individuals": time_in.isna()
+                & ~observations["ind_id"].isin(times.index),
+                "unknown behaviour": behaviour_type.isna(),
+                "outside time in frame": (observations["time"] < time_in)
+                | (observations["time"] > time_out),
+                "single timestamp State bout": single,
+                "State time exceeds time in frame": too_long,
+            },
+            observations["ind_id"],
+        )
+    )
+
+    # samples
+
+    report.append(
+        violations(
+            "samples",
+            {
+                "duplicate sample_id": samples["sample_id"].duplicated(keep=False),
+                "missing start_time": samples["start_time"].isna(),
+            },
+            samples["sample_id"],
+        )
+    )
+
+    report = pd.concat(report, ignore_index=True)
+
+    print("\n\n")
+    print("Validation")
+    print("=====================================")
+    print(report[report["violations"] > 0].to_string(index=False))
+
+    report.to_csv("outputs/data/validation.csv", index=False)
+
+    return report
+
+
+def fix_individuals(individuals):
+    """
+    Fix the individual level problems reported by validate, run after it so
+    that the report shows the raw data. Individuals without a group code are
+    treated as solitary.
+    """
+    individuals.loc[individuals["group"] < 0, "group"] = 0
+
+    return individuals
+
+
 # Data cleaning and standardisation
 print("Cleaned and standardised data")
 print("=====================================")
@@ -362,35 +664,25 @@ def calculate_duration(df, samples):
         + df["ind_id"].str.split("_").str[2]
     )
 
-    # Fix rows with 0 duration
-    for index, row in df.iterrows():
-        if row["duration"] == 0:
-            if index + 1 < len(df):
-                if df.loc[index + 1, "ind_id"] == row["ind_id"]:
-                    df.loc[index, "time_end"] = df.loc[index + 1, "time_start"]
-                    df.loc[index, "duration"] = (
-                        df.loc[index, "time_end"] - df.loc[index, "time_start"]
-                    )
-                else:
-                    sample_row = samples[samples["sample_id"] == row["sample_id"]]
-                    if not sample_row.empty:
-                        start_time = sample_row["start_time"].values[0]
-                        df.loc[index, "time_end"] = (
-                            start_time + 120
-                        ) * 1000  # assuming milliseconds
-                        df.loc[index, "duration"] = (
-                            df.loc[index, "time_end"] - df.loc[index, "time_start"]
-                        )
-            else:
-                sample_row = samples[samples["sample_id"] == row["sample_id"]]
-                if not sample_row.empty:
-                    start_time = sample_row["start_time"].values[0]
-                    df.loc[index, "time_end"] = (
-                        start_time + 120
-                    ) * 1000  # assuming milliseconds
-                    df.loc[index, "duration"] = (
-                        df.loc[index, "time_end"] - df.loc[index, "time_start"]
-                    )
+    # Fix rows with 0 duration: end at the start of the individual's next
+    # behaviour, or else at the end of the sample
+
+    zero = df["duration"] == 0
+    next_behaviour = df["ind_id"].duplicated(keep="last")
+
+    sample_end = (
+        df["sample_id"].map(
+            samples.drop_duplicates("sample_id").set_index("sample_id")["start_time"]
+        )
+        + 120
+    ) * 1000  # assuming milliseconds
+
+    fix_next = zero & next_behaviour
+    fix_sample = zero & ~next_behaviour & sample_end.notna()
+
+    df.loc[fix_next, "time_end"] = df["time_start"].shift(-1)[fix_next]
+    df.loc[fix_sample, "time_end"] = sample_end[fix_sample]
+    df["duration"] = df["time_end"] - df["time_start"]
 
     df["duration"] = df["duration"] / (1000)
 
@@ -413,9 +705,12 @@ def transform_behaviours(observations, behaviours, samples):
 
             df = df[["ind_id", "behaviour", "duration"]]
 
-            df = df.pivot(
-                index="ind_id", columns="behaviour", values="duration"
-            ).reset_index()
+            # one column per state, also without observations of it
+            df = (
+                df.pivot(index="ind_id", columns="behaviour", values="duration")
+                .reindex(columns=[row["name"]])
+                .reset_index()
+            )
 
         df.columns = df.columns.str.lower()
         df.columns = df.columns.str.replace("-", "_")
@@ -426,7 +721,191 @@ def transform_behaviours(observations, behaviours, samples):
     return data
 
 
-def create_response(individuals, observations, behaviours, samples):
+def window_overlaps(start, end, window_starts, window_ends):
+    """
+    Pair intervals [start, end] with every window they overlap.
+
+    Windows are sorted, so the first and last window of each interval are
+    found with searchsorted and the pairs are expanded without looping.
+    Points (start == end) are paired with the windows containing them.
+
+    Returns:
+        tuple: (interval index, window index, overlap) arrays
+    """
+    first = np.searchsorted(window_ends, start, side="right")
+    last = np.searchsorted(window_starts, end, side="right")
+    n = np.maximum(last - first, 0)
+
+    interval = np.repeat(np.arange(len(start)), n)
+    window = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + first[interval]
+
+    overlap = np.minimum(end[interval], window_ends[window]) - np.maximum(
+        start[interval], window_starts[window]
+    )
+
+    return interval, window, np.maximum(overlap, 0)
+
+
+def behaviour_windows(
+    individuals, observations, behaviours, samples, window=10, step=10, length=120
+):
+    """
+    Behaviour budgets in sliding windows since the start of each sample.
+
+    State behaviours have the fraction of the observed time in each window
+    spent in the behaviour, Event behaviours the rate of events per second
+    observed in the window. Windows in which an individual was not observed
+    are left out.
+
+    Args:
+        window (float): Window length in seconds.
+        step (float): Seconds between window starts.
+        length (float): Length of a sample in seconds.
+
+    Returns:
+        pd.DataFrame: Long table of ind_id, window (start in seconds),
+        behaviour, fraction (States) and rate (Events).
+    """
+    window_starts = np.arange(0, length, step, dtype=float)
+    window_ends = np.minimum(window_starts + window, length)
+
+    # sample start of each individual, times in seconds since sample start
+
+    start_times = samples.drop_duplicates("sample_id").set_index("sample_id")[
+        "start_time"
+    ]
+
+    def since_start(ind_id, time):
+        sample_id = ind_id.str.rsplit("_", n=1).str[0]
+        return (time / 1000 - sample_id.map(start_times)).to_numpy(dtype=float)
+
+    observed = individuals[["ind_id"]].copy()
+    observed["time_in"] = since_start(individuals["ind_id"], individuals["time_in"])
+    observed["time_out"] = since_start(individuals["ind_id"], individuals["time_out"])
+    observed = observed.dropna().reset_index(drop=True)
+
+    index, k, seconds = window_overlaps(
+        observed["time_in"].to_numpy(),
+        observed["time_out"].to_numpy(),
+        window_starts,
+        window_ends,
+    )
+
+    exposure = pd.DataFrame(
+        {
+            "ind_id": observed["ind_id"].to_numpy()[index],
+            "window": window_starts[k],
+            "observed": seconds,
+        }
+    )
+    exposure = exposure[exposure["observed"] > 0]
+
+    # State bouts from the first to the last record of each behaviour, ended
+    # at the individual's next State onset (of any behaviour) so that bouts do
+    # not overlap; single-record bouts last until that onset or time_out.
+    # Clipped to the observed time
+
+    types = behaviours.set_index("name")["type"]
+    names = {
+        name: name.lower().replace(" ", "_").replace("-", "_") for name in types.index
+    }
+    names.update({"Feeding": "foraging", "Moving": "movement"})
+
+    states = (
+        observations[observations["behaviour"].map(types) == "State"]
+        .groupby(["ind_id", "behaviour"], observed=True)
+        .agg(time_start=("time", "min"), time_end=("time", "max"))
+        .reset_index()
+        .merge(observed, on="ind_id")
+    )
+
+    states["time_start"] = since_start(states["ind_id"], states["time_start"])
+    states["time_end"] = since_start(states["ind_id"], states["time_end"])
+    states = states.sort_values(["ind_id", "time_start", "behaviour"])
+
+    next_start = states.groupby("ind_id")["time_start"].shift(-1).to_numpy(dtype=float)
+    time_out = states["time_out"].to_numpy()
+    start = states["time_start"].to_numpy()
+    end = states["time_end"].to_numpy()
+
+    end = np.where(
+        end > start, end, np.where(np.isnan(next_start), time_out, next_start)
+    )
+    end = np.fmin(end, next_start)
+
+    start = np.maximum(start, states["time_in"].to_numpy())
+    end = np.minimum(end, time_out)
+
+    index, k, seconds = window_overlaps(start, end, window_starts, window_ends)
+
+    state_time = pd.DataFrame(
+        {
+            "ind_id": states["ind_id"].to_numpy()[index],
+            "window": window_starts[k],
+            "behaviour": states["behaviour"].to_numpy()[index],
+            "value": seconds,
+        }
+    )
+
+    # Events counted in every window containing them
+
+    events = observations[observations["behaviour"].map(types) == "Event"]
+    time = since_start(events["ind_id"], events["time"])
+    time = np.where(np.isnan(time), -np.inf, time)
+
+    index, k, _ = window_overlaps(time, time, window_starts, window_ends)
+
+    event_counts = pd.DataFrame(
+        {
+            "ind_id": events["ind_id"].to_numpy()[index],
+            "window": window_starts[k],
+            "behaviour": events["behaviour"].to_numpy()[index],
+            "value": 1.0,
+        }
+    )
+
+    # every behaviour in every observed window, zero if absent
+
+    totals = (
+        pd.concat([state_time, event_counts])
+        .groupby(["ind_id", "window", "behaviour"])["value"]
+        .sum()
+    )
+
+    windows = exposure.merge(pd.DataFrame({"behaviour": types.index}), how="cross")
+    windows = windows.merge(
+        totals.reset_index(), how="left", on=["ind_id", "window", "behaviour"]
+    )
+
+    # time fraction of States, events per second of Events
+
+    measure = windows["value"].fillna(0) / windows["observed"]
+    state = (windows["behaviour"].map(types) == "State").to_numpy(dtype=bool)
+
+    windows["fraction"] = measure.where(state)
+    windows["rate"] = measure.mask(state)
+    windows["behaviour"] = windows["behaviour"].map(names)
+
+    windows = windows[["ind_id", "window", "behaviour", "fraction", "rate"]]
+
+    print("\n\n")
+    print("Behaviour windows")
+    print("=====================================")
+    print(windows.head(10))
+
+    windows.to_csv("outputs/data/behaviour_windows.csv", index=False)
+
+    return windows
+
+
+def create_response(
+    individuals,
+    observations,
+    behaviours,
+    samples,
+    taxonomy,
+    path="outputs/data/response.csv",
+):
     individuals["plot_id"] = (
         individuals["ind_id"].str.split("_").str[0]
         + "_"
@@ -442,23 +921,11 @@ def create_response(individuals, observations, behaviours, samples):
             "group",
             "size_class",
             "observed_duration",
+            *SPATIAL,
+            *COPRESENCE,
         ]
     ].copy()
 
-    # extract family for each species from traits
-
-    traits = pd.read_csv("data/traits.csv")
-
-    families = traits[["Family", "Genus", "Species"]].copy()
-
-    families["Species"] = (
-        families["Genus"].str.strip() + " " + families["Species"].str.strip()
-    )
-
-    families = families[["Family", "Species"]].copy()
-
-    families.columns = ["family", "species"]
-
     # add behavioural observations
 
     ind_beh = transform_behaviours(observations, behaviours, samples)
@@ -506,9 +973,9 @@ def create_response(individuals, observations, behaviours, samples):
 
     response.loc[response["species"] == "", "species"] = "Unknown"
 
-    # add families
+    # add families, one per species
 
-    response = response.merge(families, how="left", on="species")
+    response = response.merge(taxonomy.families(), how="left", on="species")
 
     print("\n\n")
     print("Behavioural response data")
@@ -516,7 +983,8 @@ def create_response(individuals, observations, behaviours, samples):
     print("First 10 rows:\n")
     print(response.head(10))
 
-    response.to_csv("outputs/data/response.csv", index=False)
+    if path is not None:
+        response.to_csv(path, index=False)
 
     return response
 
@@ -524,27 +992,24 @@ def create_response(individuals, observations, behaviours, samples):
 # clean trait data
 
 
-def clean_guilds():
+def clean_guilds(taxonomy):
     """
     Cleans the guild data by filling in missing values based on genus and family.
 
     Args:
-        response (pd.DataFrame): The input DataFrame containing species data.
+        taxonomy (Taxonomy): Registry with the trait records.
 
     Returns:
-        pd.DataFrame: The cleaned and imputed DataFrame with relative guild memberships.
+        tuple: The cleaned and imputed relative guild memberships, wide (one
+        column per guild) and long (species, guild, weight > 0).
     """
 
-    # Load and preprocess traits data
-    traits = pd.read_csv("data/traits.csv")
-
-    traits.columns = traits.columns.str.lower()
-    traits = traits[["family", "genus", "species", "feeding.guild"]].copy()
-    traits.columns = ["family", "genus", "species", "guild"]
+    # Trait records, with normalised genus and species names
+    traits = taxonomy.traits.copy()
 
     # Create a reliable mapping from genus to family from existing data
     family_map = (
-        traits[["genus", "family"]][traits["family"] != ""]
+        traits[["genus", "family"]][traits["family"].fillna("") != ""]
         .dropna()
         .drop_duplicates()
         .set_index("genus")["family"]
@@ -552,7 +1017,7 @@ def clean_guilds():
 
     # Create a reliable mapping from genus to guild using mode
     genus_guild_map = (
-        traits[["genus", "guild"]][traits["guild"] != ""]
+        traits[["genus", "guild"]][traits["guild"].fillna("") != ""]
         .groupby(["genus", "guild"])
         .size()
         .reset_index(name="count")
@@ -567,7 +1032,7 @@ def clean_guilds():
     # create a reliable mapping from family to guild using mode
 
     family_guild_map = (
-        traits[["family", "guild"]][traits["guild"] != ""]
+        traits[["family", "guild"]][traits["guild"].fillna("") != ""]
         .groupby(["family", "guild"])
         .size()
         .reset_index(name="count")
@@ -579,44 +1044,30 @@ def clean_guilds():
         .to_dict()
     )
 
-    # Combine genus and species to create a consistent 'species' column
-    traits["genus"] = traits["genus"].str.strip()
-    traits["species"] = traits["genus"].fillna("") + " " + traits["species"].fillna("")
-    traits["species"] = traits["species"].str.strip()
-
     # Identify and add missing species from 'response' to 'traits'
 
     # --- Imputation Logic ---
 
     # 1. Complete family where missing based on genus
 
-    for index, row in traits.iterrows():
-        if row["family"] == "":
-            if row["genus"] in family_map:
-                traits.at[index, "family"] = family_map[row["genus"]]
-            else:
-                # If genus is not in the map, set family to "Unknown"
-                traits.at[index, "family"] = ""
+    missing = traits["family"].eq("").fillna(False)
+    traits.loc[missing, "family"] = (
+        traits.loc[missing, "genus"].map(family_map).fillna("")
+    )
 
     # 2. Complete guild based on genus using mode
 
-    for index, row in traits.iterrows():
-        if row["guild"] == "" or row["guild"] == "Unknown":
-            if row["genus"] in genus_guild_map:
-                traits.at[index, "guild"] = genus_guild_map[row["genus"]]
-            else:
-                # If genus is not in the map, set guild to "Unknown"
-                traits.at[index, "guild"] = "Unknown"
+    unknown = traits["guild"].isin(["", "Unknown"])
+    traits.loc[unknown, "guild"] = (
+        traits.loc[unknown, "genus"].map(genus_guild_map).fillna("Unknown")
+    )
 
     # 3. Complete guild based on family using mode (for remaining blanks)
 
-    for index, row in traits.iterrows():
-        if row["guild"] == "" or row["guild"] == "Unknown":
-            if row["family"] in family_guild_map:
-                traits.at[index, "guild"] = family_guild_map[row["family"]]
-            else:
-                # If family is not in the map, set guild to "Unknown"
-                traits.at[index, "guild"] = "Unknown"
+    unknown = traits["guild"].isin(["", "Unknown"])
+    traits.loc[unknown, "guild"] = (
+        traits.loc[unknown, "family"].map(family_guild_map).fillna("Unknown")
+    )
 
     # Drop unnecessary columns
     traits.drop(columns=["genus"], inplace=True)
@@ -646,19 +1097,44 @@ def clean_guilds():
         index="species", columns="guild", values="value", fill_value=0
     ).reset_index()
 
+    # Long format, one row per species and guild it belongs to
+    guilds_long = traits_pivot.melt(
+        id_vars="species", var_name="guild", value_name="weight"
+    )
+    guilds_long = (
+        guilds_long[guilds_long["weight"] > 0]
+        .sort_values(["species", "guild"])
+        .reset_index(drop=True)
+    )
+
     print(traits_pivot.head(10))
-    return traits_pivot
+    return traits_pivot, guilds_long
 
 
-def ind_traits(individuals, guilds):
+def guild_summary(guilds_long, response):
+    """
+    Abundance and number of observed species in each guild. Species count
+    towards every guild they belong to.
+    """
+    species = response.groupby("species").size().reset_index(name="abundance")
+
+    summary = (
+        species.merge(guilds_long, on="species")
+        .groupby("guild")
+        .agg(abundance=("abundance", "sum"), species=("species", "count"))
+        .reset_index()
+    )
+
+    return summary
+
+
+def ind_traits(individuals, guilds_long, path="outputs/data/individual_traits.csv"):
     """
     Create a table with individual id, species, size class, and foraging guild.
-    Foraging guild is assigned as the guild with the highest value for each species.
+    Foraging guild is assigned as the guild with the highest weight for each species.
     """
     # Find the dominant guild for each species
-    guilds_long = guilds.set_index("species").stack().reset_index()
-    guilds_long.columns = ["species", "guild", "value"]
-    dominant_guild = guilds_long.loc[guilds_long.groupby("species")["value"].idxmax()]
+    dominant_guild = guilds_long.loc[guilds_long.groupby("species")["weight"].idxmax()]
     dominant_guild = dominant_guild[["species", "guild"]]
 
     # Merge with individuals
@@ -669,11 +1145,14 @@ def ind_traits(individuals, guilds):
             "group",
             "size_class",
             "observed_duration",
+            *SPATIAL,
+            *COPRESENCE,
         ]
     ].copy()
     table = table.merge(dominant_guild, how="left", on="species")
 
-    table.to_csv("outputs/data/individual_traits.csv", index=False)
+    if path is not None:
+        table.to_csv(path, index=False)
 
     return table
 
@@ -681,17 +1160,46 @@ def ind_traits(individuals, guilds):
 # main function
 
 
-def clean_data():
+def clean_data(publish=False, folder=None):
+    """
+    Clean all data.
+
+    Args:
+        publish (bool): Also publish the numeric outputs (shared.FRAMES) for
+            process pool workers, see shared.attach.
+        folder (str): Publish to memory-mapped .npy files in this folder
+            instead of shared memory.
+
+    Returns:
+        dict: Cleaned data frames, with the shared.SharedData handle under
+        "shared" when published.
+    """
     if not os.path.exists("outputs"):
         os.makedirs("outputs")
 
-    individuals = clean_individuals()
+    # parse all input files concurrently, loaders wait for their file
+    readers.preload()
+
+    # species names are resolved against the trait table
+    taxonomy = Taxonomy.load()
+
+    raw_individuals = read_individuals()
+    individuals = clean_individuals(raw_individuals, taxonomy)
     observations = clean_observations()
     behaviours = metadata()
     samples = clean_samples()
-    guilds = clean_guilds()
-    individuals_guild = ind_traits(individuals, guilds)
-    response = create_response(individuals_guild, observations, behaviours, samples)
+
+    validation = validate(individuals, observations, samples, behaviours)
+    individuals = fix_individuals(individuals)
+
+    guilds, guilds_long = clean_guilds(taxonomy)
+    individuals_guild = ind_traits(individuals, guilds_long)
+    traits_table = individuals_guild.copy()
+    response = create_response(
+        individuals_guild, observations, behaviours, samples, taxonomy
+    )
+    guilds_summary = guild_summary(guilds_long, response)
+    windows = behaviour_windows(individuals, observations, behaviours, samples)
 
     predators = clean_predators()
     abundance = calc_abn(individuals_guild, predators)
@@ -703,9 +1211,14 @@ def clean_data():
     rug, rugosity = clean_rugosity()
     predictors = create_predictors(sites, rug, benthic_classes, abundance)
 
+    cube = Cube.from_response(response, predictors)
+    cube.save("outputs/data/cube.npz")
+
+    save_snapshot(raw_individuals, observations, response, traits_table)
+
     print("Data cleaning complete\n")
 
-    return {
+    data = {
         "individuals": individuals,
         "observations": observations,
         "predators": predators,
@@ -717,11 +1230,228 @@ def clean_data():
         "abundance_size": abundance_size,
         "predictors": predictors,
         "response": response,
+        "windows": windows,
         "guilds": guilds,
+        "guilds_long": guilds_long,
+        "guild_summary": guilds_summary,
+        "validation": validation,
+        "cube": cube,
+    }
+
+    if publish:
+        data["shared"] = shared.publish(
+            {name: data[name] for name in shared.FRAMES}, folder
+        )
+
+    return data
+
+
+# delta processing
+
+SNAPSHOT = "outputs/data/snapshot.pkl"
+
+# inputs other than individuals and observations, changes to them need a
+# full rebuild
+DELTA_INPUTS = [
+    "data/behaviours.csv",
+    "data/predators.csv",
+    "data/samples.csv",
+    "data/traits.csv",
+]
+
+
+# outputs of clean_data that update_data leaves as they were, they need a
+# full run after a delta update
+DELTA_STALE = [
+    "outputs/data/abundance_size.csv",
+    "outputs/data/behaviour_windows.csv",
+    "outputs/data/cube.npz",
+    "outputs/data/predictors.csv",
+    "outputs/data/validation.csv",
+]
+
+
+def input_hashes():
+    hashes = {}
+    for path in DELTA_INPUTS:
+        with open(path, "rb") as f:
+            hashes[path] = hashlib.md5(f.read()).hexdigest()
+
+    return hashes
+
+
+def save_snapshot(
+    individuals, observations, response, individual_traits, path=SNAPSHOT
+):
+    """
+    Store the processed inputs and individual level outputs for update_data.
+    """
+    pd.to_pickle(
+        {
+            "inputs": input_hashes(),
+            "individuals": individuals,
+            "observations": observations,
+            "response": response,
+            "individual_traits": individual_traits,
+        },
+        path,
+    )
+
+
+def changed_ids(old, new):
+    """
+    ind_ids whose rows were added, removed or changed, ignoring row order.
+    """
+
+    def digests(table):
+        rows = pd.util.hash_pandas_object(table, index=False).to_numpy()
+        return (
+            pd.Series(rows)
+            .groupby(table["ind_id"].to_numpy())
+            .agg(lambda h: hash(tuple(sorted(h))))
+        )
+
+    both = pd.concat([digests(old), digests(new)], axis=1)
+
+    return set(both.index[both[0] != both[1]])
+
+
+def affected_ids(individuals, changed):
+    """
+    Individuals whose cleaned rows depend on the changed ones. Spatial and
+    co-presence features are computed within video files and samples, so
+    all individuals sharing a file or sample with a changed one are
+    affected, transitively.
+    """
+    file = individuals["file"].fillna("")
+    sample_id = individuals["ind_id"].str.rsplit("_", n=1).str[0]
+
+    affected = individuals["ind_id"].isin(changed)
+    while True:
+        grown = (
+            affected | file.isin(file[affected]) | sample_id.isin(sample_id[affected])
+        )
+        if grown.sum() == affected.sum():
+            break
+        affected = grown
+
+    return set(individuals["ind_id"][affected])
+
+
+def patch(table, rows, ind_ids):
+    """
+    Replace the rows of recomputed individuals, drop removed ones and order
+    the rows by ind_ids, as in a full rebuild.
+    """
+    columns = list(table.columns)
+
+    kept = table[table["ind_id"].isin(ind_ids) & ~table["ind_id"].isin(rows["ind_id"])]
+    table = pd.concat([kept, rows[columns]], ignore_index=True)
+
+    # position of duplicated ind_ids, to keep their rows apart
+    order = pd.DataFrame({"ind_id": ind_ids.to_numpy()})
+    order["n"] = order.groupby("ind_id").cumcount()
+    table["n"] = table.groupby("ind_id").cumcount()
+
+    return order.merge(table, on=["ind_id", "n"], how="left")[columns]
+
+
+def update_data(snapshot=SNAPSHOT):
+    """
+    Update the individual level outputs after individuals or observations
+    were added, removed or corrected.
+
+    The inputs are compared with the snapshot of the last run by ind_id, and
+    only the rows of changed individuals (and of individuals sharing a video
+    file or sample with them) are recomputed and patched into response,
+    individual traits and abundance. The result is the same as from
+    clean_data(). Runs clean_data() instead if there is no snapshot or other
+    inputs changed. The outputs in DELTA_STALE are not updated, a warning
+    names them when anything changed.
+
+    Returns:
+        dict: Response, individual traits and abundance data frames.
+    """
+    if not os.path.exists(snapshot):
+        return clean_data()
+
+    previous = pd.read_pickle(snapshot)
+
+    readers.preload(["individuals", "observations"])
+    raw_individuals = read_individuals()
+    observations = clean_observations()
+
+    if (
+        previous["inputs"] != input_hashes()
+        or list(raw_individuals.columns) != list(previous["individuals"].columns)
+        or list(observations.columns) != list(previous["observations"].columns)
+    ):
+        return clean_data()
+
+    changed = changed_ids(previous["individuals"], raw_individuals)
+    changed |= changed_ids(previous["observations"], observations)
+    recompute = affected_ids(
+        pd.concat([previous["individuals"], raw_individuals]), changed
+    )
+
+    subset = raw_individuals[raw_individuals["ind_id"].isin(recompute)]
+
+    print("\n\n")
+    print("Delta update")
+    print("=====================================")
+    print(f"Changed individuals: {len(changed)}, recomputed: {len(subset)}")
+
+    response = previous["response"]
+    traits_table = previous["individual_traits"]
+
+    if len(subset):
+        taxonomy = Taxonomy.load()
+        individuals = fix_individuals(clean_individuals(subset, taxonomy))
+
+        _, guilds_long = clean_guilds(taxonomy)
+        traits_rows = ind_traits(individuals, guilds_long, path=None)
+        response_rows = create_response(
+            traits_rows.copy(),
+            observations[observations["ind_id"].isin(subset["ind_id"])],
+            metadata(),
+            clean_samples(),
+            taxonomy,
+            path=None,
+        )
+    else:
+        traits_rows = traits_table.iloc[:0]
+        response_rows = response.iloc[:0]
+
+    ind_ids = raw_individuals["ind_id"]
+    response = patch(response, response_rows, ind_ids)
+    traits_table = patch(traits_table, traits_rows, ind_ids)
+
+    response.to_csv("outputs/data/response.csv", index=False)
+    traits_table.to_csv("outputs/data/individual_traits.csv", index=False)
+
+    abundance = calc_abn(traits_table.copy(), clean_predators())
+
+    save_snapshot(raw_individuals, observations, response, traits_table, snapshot)
+
+    if changed:
+        print(f"Warning: not updated, run without --delta: {', '.join(DELTA_STALE)}")
+
+    return {
+        "response": response,
+        "individual_traits": traits_table,
+        "abundance": abundance,
     }
 
 
 if __name__ == "__main__":
-    state = clean_data()
+    parser = argparse.ArgumentParser(description="Clean and standardise data")
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="only update individuals that changed since the last run",
+    )
+    args = parser.parse_args()
+
+    state = update_data() if args.delta else clean_data()
     if state == 1:
         print("Data cleaning failed")
@@ -0,0 +1,402 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+
+from draws import DRAWS, open_draws
+
+# Counterfactual predictions from posterior draws
+#
+# Mirrors models/*/counterfactuals.R: every individual in the model data is
+# predicted under each of the four treatments, and treatment effects are
+# computed as log2 odds ratios (proportions) or log2 ratios (bite rates).
+# Predictions are a single matrix product over grid rows x draws, computed
+# in chunks of draws.
+
+TREATMENTS = ["positive-control", "negative-control", "grouper", "barracuda"]
+
+FACTORS = ["protection", "treatment", "guild", "size_class"]
+NUMERIC = ["rugosity_mean", "biomass", "group"]
+
+# likelihood family of each model
+
+FAMILIES = {
+    "foraging": "ordbeta",
+    "vigilance": "ordbeta",
+    "movement": "ordbeta",
+    "bites": "gamma",
+}
+
+# contrasts between treatments (treatment, reference)
+
+CONTRASTS = {
+    "Grouper": ("grouper", "positive-control"),
+    "Barracuda": ("barracuda", "positive-control"),
+    "Control": ("positive-control", "negative-control"),
+}
+
+QUANTILES = {"5th": 0.05, "25th": 0.25, "Median": 0.5, "75th": 0.75, "95th": 0.95}
+
+
+def brms_name(x):
+    """
+    Rename factor levels the way brms does in parameter names.
+    """
+    replacements = [
+        (" ", ""), ("(", ""), (")", ""), ("[", ""), ("]", ""), (",", ""),
+        ('"', ""), ("'", ""), ("?", ""), ("+", "P"), ("-", "M"), ("*", "MU"),
+        ("/", "D"), ("^", "E"), ("=", "EQ"),
+    ]  # fmt: skip
+
+    for pattern, replacement in replacements:
+        x = x.replace(pattern, replacement)
+
+    return x
+
+
+def level_key(x):
+    """
+    Loose key for matching random effect levels to draw coordinates.
+    """
+    return re.sub(r"[^A-Za-z0-9]", ".", str(x))
+
+
+def model_data(bites=False):
+    """
+    Prepare the model data as in models/*/model.R.
+    """
+    responses = pd.read_csv("outputs/data/response.csv")
+    predictors = pd.read_csv("outputs/data/predictors.csv")
+
+    # R reads missing strings as ""
+    responses[["guild", "family"]] = responses[["guild", "family"]].fillna("")
+
+    moments_rugosity = (
+        predictors["rugosity_mean"].mean(),
+        predictors["rugosity_mean"].std(),
+    )
+    moments_biomass = predictors["biomass"].mean(), predictors["biomass"].std()
+
+    if bites:
+        responses = responses[
+            (responses["bites"] > 0) & np.isfinite(responses["bites"])
+        ]
+
+    data = responses.merge(predictors, how="left", on="plot_id")
+    data = data.drop(columns=["sponge"])
+    data = data[~data["guild"].isin(["Piscivore", "Unknown", ""])]
+    data = data[data["observed_duration"] > 45]
+
+    data["deployment_id"] = data["plot_id"].str.split("_").str[0]
+    data["rugosity_mean"] = (
+        data["rugosity_mean"] - moments_rugosity[0]
+    ) / moments_rugosity[1]
+    data["biomass"] = (data["biomass"] - moments_biomass[0]) / moments_biomass[1]
+
+    data = data[data["treatment"].isin(TREATMENTS)].drop_duplicates()
+
+    return data.reset_index(drop=True)
+
+
+def counterfactual_grid(data):
+    """
+    Distinct individuals whose treatment is set counterfactually.
+    """
+    grid = data[
+        [
+            "ind_id",
+            "plot_id",
+            "deployment_id",
+            "family",
+            "species",
+            "guild",
+            "size_class",
+            "protection",
+            "group",
+            "rugosity_mean",
+            "biomass",
+        ]
+    ].drop_duplicates()
+
+    return grid.reset_index(drop=True)
+
+
+def design_matrix(grid, coefficients):
+    """
+    Build the population-level design matrix for brms coefficient names.
+
+    Each coefficient name (without the "b_" prefix) is split into its
+    interaction components, e.g. "protectionProtected:treatmentgrouper", and
+    the column is the product of the matching indicators and covariates.
+
+    Args:
+        grid (pd.DataFrame): Prediction grid, including a treatment column.
+        coefficients (list): Coefficient names, e.g. "Intercept", "biomass".
+
+    Returns:
+        np.ndarray: Design matrix, rows x coefficients.
+    """
+    X = np.ones((len(grid), len(coefficients)))
+
+    # indicator columns for every factor level, keyed by their brms name
+
+    indicators = {}
+    for factor in FACTORS:
+        values = grid[factor].astype(str)
+        for level in values.unique():
+            indicators[factor + brms_name(level)] = (values == level).to_numpy(
+                dtype=float
+            )
+
+    for j, coefficient in enumerate(coefficients):
+        if coefficient == "Intercept":
+            continue
+
+        for component in coefficient.split(":"):
+            if component in NUMERIC:
+                X[:, j] *= grid[component].to_numpy(dtype=float)
+            elif component in indicators:
+                X[:, j] *= indicators[component]
+            else:
+                # level absent from the grid
+                X[:, j] = 0
+
+    return X
+
+
+def group_index(labels, levels):
+    """
+    Position of each grid label among the random effect levels, -1 if absent.
+    """
+    keys = pd.Index([level_key(level) for level in levels])
+    return keys.get_indexer([level_key(label) for label in labels])
+
+
+def expected_value(eta, draws, family):
+    """
+    Expected response given the linear predictor (rows x draws).
+    """
+    if family == "gamma":
+        return np.exp(eta)
+
+    # ordered beta: P(y = 1) + P(0 < y < 1) * E[y | 0 < y < 1]
+
+    thresh_zero = draws["cutzero"]
+    thresh_one = draws["cutzero"] + np.exp(draws["cutone"])
+
+    p_above_zero = expit(eta - thresh_zero)
+    p_one = expit(eta - thresh_one)
+
+    return p_one + (p_above_zero - p_one) * expit(eta)
+
+
+def predict(name, grid, chunk_size=500):
+    """
+    Posterior expected response of every grid row under every treatment.
+
+    Args:
+        name (str): Model name, one of FAMILIES.
+        grid (pd.DataFrame): Counterfactual grid of individuals.
+        chunk_size (int): Number of draws per matrix product.
+
+    Returns:
+        np.ndarray: Predictions, draws x treatments x individuals.
+    """
+    posterior = open_draws(name)
+
+    # population-level effects on the mean (not on phi)
+
+    coefficients = [
+        var[2:]
+        for var in posterior.data_vars
+        if var.startswith("b_") and not var.startswith("b_phi_")
+    ]
+    variables = ["b_" + coefficient for coefficient in coefficients]
+
+    # stack the grid under each treatment
+
+    stacked = pd.concat(
+        [grid.assign(treatment=treatment) for treatment in TREATMENTS],
+        ignore_index=True,
+    )
+    X = design_matrix(stacked, coefficients)
+
+    # random intercepts for deployments and species
+
+    random_effects = []
+    for var, labels in [
+        ("r_deployment_id", stacked["deployment_id"]),
+        ("r_family:species", stacked["family"].fillna("") + "_" + stacked["species"]),
+    ]:
+        if var in posterior:
+            levels = posterior[var][f"{var}_dim_0"].values
+            random_effects.append((var, group_index(labels, levels)))
+
+    n_chains, n_draws = posterior.sizes["chain"], posterior.sizes["draw"]
+
+    predictions = np.empty((n_chains * n_draws, len(TREATMENTS), len(grid)))
+
+    for chain in range(n_chains):
+        for start in range(0, n_draws, chunk_size):
+            # only this block of draws is read from disk
+            chunk = posterior.isel(chain=chain, draw=slice(start, start + chunk_size))
+
+            B = np.stack([chunk[var].values for var in variables])
+            eta = X @ B
+
+            for var, index in random_effects:
+                r = chunk[var].isel({f"{var}_dim_1": 0}).values.T
+                r = np.vstack([r, np.zeros((1, r.shape[1]))])  # absent levels -> 0
+                eta += r[index]
+
+            family_draws = {}
+            if FAMILIES[name] == "ordbeta":
+                family_draws = {par: chunk[par].values for par in ["cutzero", "cutone"]}
+
+            mu = expected_value(eta, family_draws, FAMILIES[name])
+
+            rows = slice(
+                chain * n_draws + start, chain * n_draws + start + chunk.sizes["draw"]
+            )
+            predictions[rows] = mu.T.reshape(-1, len(TREATMENTS), len(grid))
+
+    return predictions
+
+
+def effects(predictions, family):
+    """
+    Treatment contrasts on the log2 odds (proportions) or log2 scale.
+
+    Returns:
+        dict: contrast -> draws x individuals
+    """
+    if family == "gamma":
+        scale = np.log2(predictions)
+    else:
+        scale = np.log2(predictions / (1 - predictions))
+
+    return {
+        contrast: scale[:, TREATMENTS.index(treatment)]
+        - scale[:, TREATMENTS.index(reference)]
+        for contrast, (treatment, reference) in CONTRASTS.items()
+    }
+
+
+def summarise_effects(effect, grid, groups):
+    """
+    Quantiles and P(> 0) of effects pooled over draws and individuals.
+
+    Returns:
+        pd.DataFrame: One row per group, with per draw group means kept in
+        the "draws" column for comparisons.
+    """
+    rows = []
+
+    keys = (
+        grid[groups].drop_duplicates().sort_values(groups)
+        if groups
+        else pd.DataFrame([{}])
+    )
+
+    for _, key in keys.iterrows():
+        mask = np.ones(len(grid), dtype=bool)
+        for group in groups:
+            mask &= (grid[group] == key[group]).to_numpy()
+
+        values = effect[:, mask]
+
+        row = dict(key)
+        row.update(zip(QUANTILES, np.quantile(values, list(QUANTILES.values()))))
+        row["P(> 0)"] = np.mean(values > 0)
+        row["draws"] = values.mean(axis=1)
+
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def run_counterfactuals(models=None, folder="outputs/analysis", chunk_size=500):
+    """
+    Compute counterfactual effects for all models and write the summary
+    and comparison tables used by functions/analysis_tables.R.
+    """
+    if models is None:
+        models = [name for name in FAMILIES if os.path.exists(DRAWS[name] + ".nc")]
+
+    os.makedirs(folder, exist_ok=True)
+
+    groupings = {
+        "effects_treatment": [],
+        "response_guild": ["guild"],
+        "response_protection": ["protection"],
+        "response_size": ["size_class"],
+    }
+
+    summaries = {table: [] for table in groupings}
+
+    for name in models:
+        grid = counterfactual_grid(model_data(bites=FAMILIES[name] == "gamma"))
+
+        predictions = predict(name, grid, chunk_size)
+
+        for contrast, effect in effects(predictions, FAMILIES[name]).items():
+            for table, groups in groupings.items():
+                summary = summarise_effects(effect, grid, groups)
+                summary.insert(0, "Treatment", contrast)
+                summary.insert(0, "Behaviour", name.title())
+                summaries[table].append(summary)
+
+    for table, groups in groupings.items():
+        df = pd.concat(summaries[table], ignore_index=True)
+        df = df.rename(columns={"protection": "Protection"})
+        keys = ["Behaviour"] + [{"protection": "Protection"}.get(g, g) for g in groups]
+
+        # P(Grouper > Barracuda) from per draw group means
+
+        grouper = df[df["Treatment"] == "Grouper"].set_index(keys)["draws"]
+        barracuda = df[df["Treatment"] == "Barracuda"].set_index(keys)["draws"]
+
+        compare = pd.DataFrame(
+            {
+                "Grouper > Barracuda": [
+                    np.mean(g > b)
+                    for g, b in zip(grouper, barracuda.loc[grouper.index])
+                ]
+            },
+            index=grouper.index,
+        ).reset_index()
+
+        compare.to_csv(os.path.join(folder, f"compare_{table}.csv"), index=False)
+
+        # P(Inside > Outside) for each treatment
+
+        if table == "response_protection":
+            draws = df.set_index(["Behaviour", "Treatment", "Protection"])["draws"]
+            inside = draws.xs("Protected", level="Protection")
+            outside = draws.xs("Unprotected", level="Protection")
+
+            difference = pd.DataFrame(
+                {
+                    "Difference": [
+                        np.mean(i > o)
+                        for i, o in zip(inside, outside.loc[inside.index])
+                    ]
+                },
+                index=inside.index,
+            ).reset_index()
+
+            difference.to_csv(
+                os.path.join(folder, "effect_protection.csv"), index=False
+            )
+
+        df.drop(columns=["draws"]).to_csv(
+            os.path.join(folder, f"summary_{table}.csv"), index=False
+        )
+
+    print(f"Counterfactual summaries written to {folder}")
+
+
+if __name__ == "__main__":
+    run_counterfactuals()
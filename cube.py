@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+
+# Aggregate cube of plot-level responses
+#
+# Individuals are aggregated once into dense arrays over categorical axes
+# (plot x guild x size class x species): the number of individuals and
+# their summed observed and behaviour durations. Treatment and protection
+# are plot labels, so roll-ups by them group the plot axis. Roll-ups and
+# slices work on the arrays and never rescan individual rows.
+
+AXES = ["plot_id", "guild", "size_class", "species"]
+PLOT_LABELS = ["treatment", "protection"]
+
+BEHAVIOURS = ["foraging", "vigilance", "movement"]
+MEASURES = ["count", "observed_duration", *BEHAVIOURS]
+
+
+class Cube:
+    """
+    Dense aggregates over categorical axes.
+
+    Args:
+        values (np.ndarray): Aggregates, measures x plots x guilds x size
+            classes x species.
+        axes (dict): Axis name -> labels, in AXES order.
+        plots (pd.DataFrame): Treatment and protection of each plot, indexed
+            by plot_id in axis order.
+    """
+
+    def __init__(self, values, axes, plots):
+        self.values = values
+        self.axes = {name: pd.Index(labels, name=name) for name, labels in axes.items()}
+        self.plots = plots
+
+    @classmethod
+    def from_response(cls, response, predictors):
+        """
+        Aggregate the response data of individuals.
+
+        Individuals without a guild are counted as "Unknown". Behaviour
+        proportions are converted back to seconds before summing.
+        """
+        individuals = response.drop_duplicates("ind_id").copy()
+        individuals["guild"] = individuals["guild"].fillna("Unknown")
+
+        plots = (
+            predictors.drop_duplicates("plot_id")
+            .set_index("plot_id")[PLOT_LABELS]
+            .sort_index()
+        )
+
+        axes = {"plot_id": plots.index}
+        for axis in AXES[1:]:
+            axes[axis] = np.sort(individuals[axis].unique())
+
+        codes = tuple(
+            pd.Index(axes[axis]).get_indexer(individuals[axis]) for axis in AXES
+        )
+        keep = np.all([code >= 0 for code in codes], axis=0)
+        codes = tuple(code[keep] for code in codes)
+        individuals = individuals[keep]
+
+        measures = np.column_stack(
+            [
+                np.ones(len(individuals)),
+                individuals["observed_duration"],
+                *[
+                    individuals[b].fillna(0) * individuals["observed_duration"]
+                    for b in BEHAVIOURS
+                ],
+            ]
+        )
+
+        shape = tuple(len(labels) for labels in axes.values())
+        values = np.zeros((len(MEASURES), *shape))
+
+        flat = np.ravel_multi_index(codes, shape)
+        for m in range(len(MEASURES)):
+            values[m] = np.bincount(
+                flat, weights=measures[:, m], minlength=np.prod(shape)
+            ).reshape(shape)
+
+        return cls(values, axes, plots)
+
+    def sel(self, **labels):
+        """
+        Slice the cube by labels of its axes or of the plots, e.g.
+        cube.sel(guild="Herbivore", protection="Protected").
+
+        Each argument is a label or a list of labels.
+        """
+        positions = {axis: np.arange(len(self.axes[axis])) for axis in AXES}
+        plots = np.ones(len(self.plots), dtype=bool)
+
+        for name, selection in labels.items():
+            selection = np.atleast_1d(selection)
+
+            if name in PLOT_LABELS:
+                plots &= self.plots[name].isin(selection).to_numpy()
+            elif name in AXES:
+                position = self.axes[name].get_indexer(selection)
+                if (position < 0).any():
+                    raise KeyError(f"Unknown {name}: {list(selection[position < 0])}")
+                positions[name] = position
+            else:
+                raise KeyError(f"Unknown axis: {name}")
+
+        positions["plot_id"] = positions["plot_id"][plots[positions["plot_id"]]]
+
+        values = self.values[(slice(None), *np.ix_(*positions.values()))]
+        axes = {axis: self.axes[axis][positions[axis]] for axis in AXES}
+
+        return Cube(values, axes, self.plots.iloc[positions["plot_id"]])
+
+    def rollup(self, by=()):
+        """
+        Sum over all dimensions except `by`, which can include axes and plot
+        labels, e.g. cube.rollup(["treatment", "guild"]).
+
+        Returns:
+            pd.DataFrame: One row per combination of `by`, with all measures.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+
+        unknown = set(by) - set(AXES) - set(PLOT_LABELS)
+        if unknown:
+            raise KeyError(f"Unknown axes: {sorted(unknown)}")
+
+        grouped = [label for label in PLOT_LABELS if label in by]
+        kept = [axis for axis in AXES if axis in by or (axis == "plot_id" and grouped)]
+
+        values = self.values.sum(
+            axis=tuple(i + 1 for i, axis in enumerate(AXES) if axis not in kept)
+        )
+        dims = [self.axes[axis].to_frame(index=False) for axis in kept]
+
+        if grouped:
+            # group the plot axis by the plot labels (and plot_id if kept)
+            groups = self.plots[grouped].reset_index()
+            if "plot_id" not in by:
+                groups = groups.drop(columns="plot_id")
+
+            levels = groups.drop_duplicates().sort_values(list(groups.columns))
+            codes = pd.MultiIndex.from_frame(levels).get_indexer(
+                pd.MultiIndex.from_frame(groups)
+            )
+
+            indicator = np.zeros((len(levels), len(codes)))
+            indicator[codes, np.arange(len(codes))] = 1
+
+            values = np.moveaxis(np.tensordot(indicator, values, axes=(1, 1)), 0, 1)
+            dims[0] = levels
+
+        # long format, one row per cell
+
+        cells = [code.ravel() for code in np.indices(values.shape[1:])]
+        labels = [
+            dim.iloc[code].reset_index(drop=True) for dim, code in zip(dims, cells)
+        ]
+        measures = pd.DataFrame(values.reshape(len(MEASURES), -1).T, columns=MEASURES)
+        measures["count"] = measures["count"].astype(int)
+
+        frame = pd.concat([*labels, measures], axis=1)
+
+        return frame[by + MEASURES]
+
+    def save(self, path):
+        np.savez(
+            path,
+            values=self.values,
+            plots=self.plots.reset_index().to_numpy(dtype=str),
+            **{
+                f"axis_{axis}": np.asarray(labels, dtype=str)
+                for axis, labels in self.axes.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            axes = {axis: f[f"axis_{axis}"] for axis in AXES}
+            plots = pd.DataFrame(f["plots"], columns=["plot_id", *PLOT_LABELS])
+
+            return cls(f["values"], axes, plots.set_index("plot_id"))
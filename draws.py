@@ -0,0 +1,156 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Posterior draws store
+#
+# Model scripts write their draws with posterior::as_draws_df. These are
+# converted to ArviZ InferenceData files (netCDF, posterior and sample_stats
+# groups) chunked along the draw dimension, so that single parameters can be
+# read without deserialising the whole fit.
+
+DRAWS = {
+    "foraging": "outputs/behaviour-time/draws_foraging",
+    "vigilance": "outputs/behaviour-time/draws_vigilance",
+    "movement": "outputs/behaviour-time/draws_movement",
+    "bites": "outputs/behaviour-bites/draws",
+}
+
+CHUNK_SIZE = 250  # draws per chunk
+
+NAME_PATTERN = re.compile(r"^(?P<var>[^\[]+)(\[(?P<index>.*)\])?$")
+
+
+def parse_names(columns):
+    """
+    Group brms draw names by variable.
+
+    Indexed names such as "r_deployment_id[20241213,Intercept]" are split
+    into the variable name and their index labels.
+
+    Returns:
+        dict: variable name -> list of (column, index labels)
+    """
+    variables = {}
+
+    for column in columns:
+        match = NAME_PATTERN.match(column)
+        index = match.group("index")
+        labels = tuple(index.split(",")) if index is not None else ()
+
+        variables.setdefault(match.group("var"), []).append((column, labels))
+
+    return variables
+
+
+def to_dataset(draws):
+    """
+    Convert a draws data frame to a (chain, draw, ...) dataset.
+    """
+    chains = np.sort(draws[".chain"].unique())
+    draws = draws.sort_values([".chain", ".iteration"])
+    n_draws = len(draws) // len(chains)
+
+    variables = parse_names([col for col in draws.columns if not col.startswith(".")])
+
+    data_vars = {}
+    coords = {"chain": chains, "draw": np.arange(n_draws)}
+
+    for var, entries in variables.items():
+        values = draws[[col for col, _ in entries]].to_numpy(dtype=float)
+        values = values.reshape(len(chains), n_draws, len(entries))
+
+        labels = [labels for _, labels in entries]
+        ndim = len(labels[0])
+
+        if ndim == 0:
+            data_vars[var] = (("chain", "draw"), values[:, :, 0])
+            continue
+
+        # lay indexed draws out on the full grid of labels
+
+        dims = [f"{var}_dim_{i}" for i in range(ndim)]
+        levels = [
+            list(dict.fromkeys(label[i] for label in labels)) for i in range(ndim)
+        ]
+        positions = tuple(
+            pd.Index(levels[i]).get_indexer([label[i] for label in labels])
+            for i in range(ndim)
+        )
+
+        grid = np.full((len(chains), n_draws, *map(len, levels)), np.nan)
+        grid[(slice(None), slice(None), *positions)] = values
+
+        data_vars[var] = (("chain", "draw", *dims), grid)
+        coords.update(zip(dims, levels))
+
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def export_draws(name, chunk_size=CHUNK_SIZE, remove_csv=True):
+    """
+    Convert the draws CSV written by a model script to a netCDF draws store.
+    """
+    path = DRAWS[name]
+
+    dataset = to_dataset(pd.read_csv(path + ".csv"))
+
+    # sampler quantities go to sample_stats, as in ArviZ
+
+    stats = [var for var in dataset.data_vars if var.endswith("__")]
+    sample_stats = dataset[stats].rename({var: var.rstrip("_") for var in stats})
+    posterior = dataset.drop_vars(stats)
+
+    encoding = {
+        var: {
+            "chunksizes": (1, min(chunk_size, posterior.sizes["draw"]), *data.shape[2:])
+        }
+        for var, data in posterior.data_vars.items()
+    }
+
+    posterior.to_netcdf(
+        path + ".nc", group="posterior", engine="h5netcdf", encoding=encoding
+    )
+    sample_stats.to_netcdf(
+        path + ".nc", group="sample_stats", engine="h5netcdf", mode="a"
+    )
+
+    if remove_csv:
+        os.remove(path + ".csv")
+
+    print(f"Draws for {name} written to {path}.nc")
+
+    return path + ".nc"
+
+
+def open_draws(name, var_names=None):
+    """
+    Open the posterior draws of a model lazily.
+
+    Only the requested variables are read from disk, and only once their
+    values are accessed.
+
+    Args:
+        name (str): Model name, one of DRAWS.
+        var_names (list): Variables to keep, all by default.
+
+    Returns:
+        xr.Dataset: Posterior draws with (chain, draw, ...) dimensions.
+    """
+    posterior = xr.open_dataset(
+        DRAWS[name] + ".nc", group="posterior", engine="h5netcdf"
+    )
+
+    if var_names is not None:
+        posterior = posterior[var_names]
+
+    return posterior
+
+
+if __name__ == "__main__":
+    for name, path in DRAWS.items():
+        if os.path.exists(path + ".csv"):
+            export_draws(name)
@@ -0,0 +1,423 @@
+import argparse
+import json
+import os
+import re
+import shutil
+
+import arviz as az
+import numpy as np
+import pandas as pd
+from cmdstanpy import CmdStanModel, from_csv
+
+from draws import DRAWS, export_draws
+
+# Stan programs for the ordered beta behaviour model
+
+STAN_FILES = {
+    "serial": "models/behaviour-time/model.stan",
+    "threaded": "models/behaviour-time/model_threaded.stan",
+}
+
+# Stan code, data, parameter names and fits for warm-started refits, exported
+# by models/behaviour-time/model.R with zero chains
+
+OUTPUT_DIR = "outputs/behaviour-time"
+
+PARAMETER_PATTERN = re.compile(
+    r"^\s*(?:array\[(?P<array>[^\]]*)\]\s*)?"
+    r"(?P<type>real|vector|row_vector|matrix)(?P<bounds><[^>]*>)?"
+    r"(?:\[(?P<dims>[^\]]*)\])?\s+(?P<name>\w+)\s*;"
+)
+
+
+def stan_model(threaded=False, stan_file=None):
+    """
+    Compile the ordered beta model.
+
+    The threaded variant partitions the likelihood with reduce_sum and is
+    compiled with STAN_THREADS. `stan_file` overrides the program, e.g. with
+    Stan code exported from brms.
+    """
+    if stan_file is None:
+        stan_file = STAN_FILES["threaded" if threaded else "serial"]
+
+    if threaded:
+        return CmdStanModel(stan_file=stan_file, cpp_options={"STAN_THREADS": True})
+
+    return CmdStanModel(stan_file=stan_file)
+
+
+def fit_stan(
+    data, threads=1, chains=4, grainsize=None, stan_file=None, model=None, **kwargs
+):
+    """
+    Fit the ordered beta model to brms standata.
+
+    Args:
+        data (dict): Stan data as produced by brms::make_standata.
+        threads (int): Threads per chain. More than one selects the reduce_sum
+            variant of the model.
+        chains (int): Number of chains, run in parallel.
+        grainsize (int): Slice size for reduce_sum, defaults to the brms
+            heuristic of N / (2 * threads) with a minimum of 100.
+        stan_file (str): Stan program to use instead of STAN_FILES.
+        model (CmdStanModel): Compiled model to use instead of compiling
+            one, e.g. from stan_model.
+        **kwargs: Passed on to CmdStanModel.sample.
+
+    Returns:
+        CmdStanMCMC: The fitted model.
+    """
+    threaded = threads > 1
+
+    if model is None:
+        model = stan_model(threaded=threaded, stan_file=stan_file)
+
+    if threaded:
+        if grainsize is None:
+            grainsize = max(100, data["N"] // (2 * threads))
+
+        data = {"grainsize": grainsize, **data}
+        kwargs["threads_per_chain"] = threads
+
+    return model.sample(data=data, chains=chains, parallel_chains=chains, **kwargs)
+
+
+## Warm starts
+
+
+def parameter_shapes(stan_file, data):
+    """
+    Shapes of the parameters declared in a Stan program, in declaration
+    order, with sizes looked up in the data.
+
+    Raises:
+        ValueError: For declarations other than real, vector and matrix
+            types (e.g. Cholesky factors), whose unconstrained size differs.
+    """
+    with open(stan_file) as f:
+        code = f.read()
+
+    block = re.search(r"\nparameters \{(.*?)\n\}", code, re.S).group(1)
+
+    def size(dim):
+        dim = dim.strip()
+        return int(dim) if dim.isdigit() else int(data[dim])
+
+    shapes = {}
+
+    for line in block.splitlines():
+        line = line.split("//")[0]
+        if not line.strip():
+            continue
+
+        match = PARAMETER_PATTERN.match(line)
+        if match is None:
+            raise ValueError(f"Unsupported parameter declaration: {line.strip()}")
+
+        dims = [
+            dim
+            for part in (match["array"], match["dims"])
+            if part
+            for dim in part.split(",")
+        ]
+
+        shapes[match["name"]] = {
+            "shape": tuple(size(dim) for dim in dims),
+            "matrix": match["type"] == "matrix",
+            "positive": match["bounds"] is not None and "lower=0" in match["bounds"],
+        }
+
+    return shapes
+
+
+def parameter_labels(name, info, names):
+    """
+    Labels along each dimension of a parameter, None for dimensions without
+    labels.
+
+    The population-level effects b are labelled by coefficient, and the
+    group-level sd_<id> and z_<id> by coefficient and level of the group.
+    """
+    groups = {str(group["id"]): group for group in names["groups"]}
+    labels = [None] * len(info["shape"])
+
+    match = re.fullmatch(r"(sd|z)_(\d+)", name)
+
+    if name == "b":
+        labels = [names["b"]]
+    elif match and match[2] in groups:
+        group = groups[match[2]]
+        labels = [group["coefficients"], group["levels"]][: len(info["shape"])]
+
+    for labels_dim, size in zip(labels, info["shape"]):
+        if labels_dim is not None and len(labels_dim) != size:
+            raise ValueError(f"Names of {name} do not match its shape")
+
+    return labels
+
+
+def align(x, labels, shape, new_labels, fill):
+    """
+    Copy `x` into an array of `shape`, matching entries by label along
+    labelled dimensions and by position along the others. Entries without a
+    match (e.g. new levels) are `fill`.
+    """
+    out = np.full(shape, fill, dtype=float)
+    source, target = [], []
+
+    for size, new_size, old, new in zip(x.shape, shape, labels, new_labels):
+        if old is None or new is None:
+            index = np.arange(new_size)
+            index[index >= size] = -1
+        else:
+            index = pd.Index(old).get_indexer(new)
+
+        target.append(np.flatnonzero(index >= 0))
+        source.append(index[index >= 0])
+
+    out[np.ix_(*target)] = x[np.ix_(*source)]
+
+    return out
+
+
+def to_unconstrained_order(x, info):
+    # Stan stores matrices column-major, arrays row-major
+    if info["matrix"]:
+        x = np.swapaxes(x, -1, -2)
+    return x.ravel()
+
+
+def from_unconstrained_order(x, info):
+    shape = info["shape"]
+    if info["matrix"]:
+        return np.swapaxes(x.reshape(*shape[:-2], shape[-1], shape[-2]), -1, -2)
+    return x.reshape(shape)
+
+
+def warm_start(previous, previous_data, previous_names, data, names, stan_file):
+    """
+    Inits, step size and inverse metric for a refit from a previous fit.
+
+    Inits are the previous posterior means and the metric is the previous
+    adapted diagonal inverse mass matrix, averaged over chains. Entries are
+    matched by coefficient and level names (see parameter_labels), so levels
+    keep their values when new ones sort before them. New levels (e.g. new
+    deployments) get 0 (or 1 for positive parameters) in the inits and 1 in
+    the metric.
+
+    Returns:
+        tuple: (inits, step size, metric)
+    """
+    if previous.metric_type != "diag_e":
+        raise ValueError("Warm starts need a diagonal metric")
+
+    old = parameter_shapes(stan_file, previous_data)
+    new = parameter_shapes(stan_file, data)
+
+    inv_metric = np.asarray(previous.metric).mean(axis=0)
+
+    if inv_metric.size != sum(int(np.prod(info["shape"])) for info in old.values()):
+        raise ValueError("Previous metric does not match the parameters")
+
+    inits = {}
+    metric = []
+    offset = 0
+
+    for name, info in new.items():
+        old_info = old[name]
+        old_size = int(np.prod(old_info["shape"]))
+
+        old_labels = parameter_labels(name, old_info, previous_names)
+        labels = parameter_labels(name, info, names)
+
+        mean = previous.stan_variable(name).mean(axis=0).reshape(old_info["shape"])
+        fill = 1.0 if info["positive"] else 0.0
+        inits[name] = align(mean, old_labels, info["shape"], labels, fill)
+
+        block = from_unconstrained_order(
+            inv_metric[offset : offset + old_size], old_info
+        )
+        block = align(block, old_labels, info["shape"], labels, 1.0)
+        metric.append(to_unconstrained_order(block, info))
+        offset += old_size
+
+    step_size = float(np.mean(previous.step_size))
+
+    return inits, step_size, {"inv_metric": np.concatenate(metric).tolist()}
+
+
+def brms_draws(fit, names):
+    """
+    Draws of a fit named as by posterior::as_draws_df for the brms model.
+
+    Args:
+        fit (CmdStanMCMC): Fit of the Stan code exported from brms.
+        names (dict): Parameter names exported by model.R, with the
+            population-level effects ("b") and the group, distributional
+            parameter, coefficients and levels of each group-level ID.
+
+    Returns:
+        pd.DataFrame: Draws with .chain, .iteration and .draw columns.
+    """
+    rename = {"chain__": ".chain", "iter__": ".iteration", "draw__": ".draw"}
+    rename.update({f"b[{k}]": f"b_{c}" for k, c in enumerate(names["b"], start=1)})
+
+    for group in names["groups"]:
+        dpar = group["dpar"]
+        i = group["id"]
+
+        for k, coefficient in enumerate(group["coefficients"], start=1):
+            sd = f"sd_{group['group']}__{dpar + '_' if dpar else ''}{coefficient}"
+            rename[f"sd_{i}[{k}]"] = sd
+
+            r = f"r_{group['group']}{'__' + dpar if dpar else ''}"
+            for n, level in enumerate(group["levels"], start=1):
+                rename[f"r_{i}_{k}[{n}]"] = f"{r}[{level},{coefficient}]"
+
+    return fit.draws_pd().rename(columns=rename)
+
+
+def diagnostics(fit, parameters):
+    """
+    Maximum R-hat and minimum bulk ESS over the model parameters.
+    """
+    summary = az.summary(
+        az.from_cmdstanpy(posterior=fit), var_names=parameters, kind="diagnostics"
+    )
+
+    return summary["r_hat"].max(), summary["ess_bulk"].min()
+
+
+def refit(
+    behaviour,
+    threads=1,
+    chains=4,
+    iter_warmup=1000,
+    warm_iter_warmup=200,
+    rhat_max=1.01,
+    ess_min=400,
+    **kwargs,
+):
+    """
+    Fit a behaviour model, warm-started from its previous fit if there is one.
+
+    The previous posterior means are used as inits and its adapted step size
+    and inverse mass matrix seed a shortened warmup. If R-hat or bulk ESS of
+    the warm-started fit degrade, the model is refit with the full warmup.
+    The accepted fit is exported to the netCDF draws store (DRAWS), read by
+    counterfactuals.py and posterior_summary.py.
+
+    Args:
+        behaviour (str): Behaviour model, e.g. "foraging".
+        threads (int): Threads per chain.
+        chains (int): Number of chains.
+        iter_warmup (int): Warmup iterations of a cold start.
+        warm_iter_warmup (int): Warmup iterations of a warm start.
+        rhat_max (float): Largest acceptable R-hat.
+        ess_min (float): Smallest acceptable bulk ESS.
+        **kwargs: Passed on to CmdStanModel.sample.
+
+    Returns:
+        CmdStanMCMC: The accepted fit.
+    """
+    stan_file = os.path.join(OUTPUT_DIR, f"model_{behaviour}.stan")
+    fit_dir = os.path.join(OUTPUT_DIR, "fits", behaviour)
+    new_dir = fit_dir + "_new"
+
+    with open(os.path.join(OUTPUT_DIR, f"standata_{behaviour}.json")) as f:
+        data = json.load(f)
+
+    with open(os.path.join(OUTPUT_DIR, f"names_{behaviour}.json")) as f:
+        names = json.load(f)
+
+    parameters = list(parameter_shapes(stan_file, data))
+
+    shutil.rmtree(new_dir, ignore_errors=True)
+    fit = None
+
+    if os.path.exists(os.path.join(fit_dir, "names.json")):
+        with open(os.path.join(fit_dir, "standata.json")) as f:
+            previous_data = json.load(f)
+
+        with open(os.path.join(fit_dir, "names.json")) as f:
+            previous_names = json.load(f)
+
+        previous = from_csv(fit_dir)
+
+        try:
+            inits, step_size, metric = warm_start(
+                previous, previous_data, previous_names, data, names, stan_file
+            )
+        except (ValueError, KeyError) as e:
+            print(f"{behaviour}: no warm start ({e})")
+        else:
+            print(f"{behaviour}: warm start with {warm_iter_warmup} warmup iterations")
+
+            fit = fit_stan(
+                data,
+                threads=threads,
+                chains=chains,
+                stan_file=stan_file,
+                inits=inits,
+                step_size=step_size,
+                metric=metric,
+                iter_warmup=warm_iter_warmup,
+                output_dir=new_dir,
+                **kwargs,
+            )
+
+            r_hat, ess_bulk = diagnostics(fit, parameters)
+            print(f"{behaviour}: R-hat {r_hat:.3f}, bulk ESS {ess_bulk:.0f}")
+
+            if r_hat > rhat_max or ess_bulk < ess_min:
+                print(f"{behaviour}: diagnostics degraded, refitting with full warmup")
+                fit = None
+
+    if fit is None:
+        shutil.rmtree(new_dir, ignore_errors=True)
+
+        fit = fit_stan(
+            data,
+            threads=threads,
+            chains=chains,
+            stan_file=stan_file,
+            iter_warmup=iter_warmup,
+            output_dir=new_dir,
+            **kwargs,
+        )
+
+    # keep the accepted fit and its data for the next refit
+
+    shutil.rmtree(fit_dir, ignore_errors=True)
+    os.rename(new_dir, fit_dir)
+
+    with open(os.path.join(fit_dir, "standata.json"), "w") as f:
+        json.dump(data, f)
+
+    with open(os.path.join(fit_dir, "names.json"), "w") as f:
+        json.dump(names, f)
+
+    fit = from_csv(fit_dir)
+
+    # draws store, as written by run.py for fits of model.R
+
+    brms_draws(fit, names).to_csv(DRAWS[behaviour] + ".csv", index=False)
+    export_draws(behaviour)
+
+    return fit
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refit behaviour models with warm starts"
+    )
+    parser.add_argument(
+        "behaviours", nargs="*", default=["foraging", "vigilance", "movement"]
+    )
+    parser.add_argument("--threads", type=int, default=1, help="threads per chain")
+    parser.add_argument("--chains", type=int, default=4)
+    args = parser.parse_args()
+
+    for behaviour in args.behaviours:
+        refit(behaviour, threads=args.threads, chains=args.chains)
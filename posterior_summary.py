@@ -0,0 +1,314 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from draws import DRAWS, open_draws
+
+# Streaming posterior summaries
+#
+# Draws are read chunk by chunk from the draws store and every statistic is
+# accumulated in a single pass, so memory does not grow with the number of
+# draws:
+#   - mean, SD and R-hat from per-chain running moments (Chan et al. merge)
+#   - quantiles and HDIs from a fixed-size quantile sketch
+#   - probability of direction from running sign counts
+#   - bulk and tail ESS from batch means
+
+MODELS = {
+    "foraging": "behaviour-time",
+    "vigilance": "behaviour-time",
+    "movement": "behaviour-time",
+    "bites": "behaviour-bites",
+}
+
+# hyperparameters summarised alongside the population-level effects
+
+HYPERPARAMETERS = ["cutzero", "cutone", "shape"]
+
+
+def interp_columns(targets, cdf, values):
+    """
+    Interpolate every column of `values` at the same cumulative positions.
+
+    Args:
+        targets (np.ndarray): Positions to evaluate, shape (k,).
+        cdf (np.ndarray): Non-decreasing positions per column, shape (m, p).
+        values (np.ndarray): Values at those positions, shape (m, p).
+
+    Returns:
+        np.ndarray: Interpolated values, shape (k, p).
+    """
+    m, p = cdf.shape
+
+    # offset columns so that one searchsorted covers all of them
+    span = np.nanmax(np.abs(cdf)) + np.abs(targets).max() + 1
+    offsets = np.arange(p) * 2 * span
+
+    flat = (cdf + offsets).T.ravel()
+    queries = (targets[:, None] + offsets).T.ravel()
+
+    upper = np.searchsorted(flat, queries)
+    column = np.repeat(np.arange(p), len(targets))
+    upper = np.clip(upper, column * m + 1, column * m + m - 1)
+    lower = upper - 1
+
+    x = values.T.ravel()
+    x0, x1 = x[lower], x[upper]
+    c0, c1 = flat[lower], flat[upper]
+
+    weight = np.clip((queries - c0) / np.where(c1 > c0, c1 - c0, 1), 0, 1)
+
+    return (x0 + weight * (x1 - x0)).reshape(p, len(targets)).T
+
+
+class QuantileSketch:
+    """
+    Fixed-size quantile summary of many columns of streaming values.
+
+    Each column is represented by `size` equally weighted points, the
+    quantiles of everything seen so far. New values are merged by
+    re-evaluating the weighted empirical quantile function.
+    """
+
+    def __init__(self, size=500):
+        self.size = size
+        self.points = None
+        self.weight = 0
+
+    def update(self, values):
+        n = len(values)
+
+        if self.points is None:
+            points, weights = values, np.ones(n)
+        else:
+            points = np.vstack([self.points, values])
+            weights = np.concatenate(
+                [np.full(self.size, self.weight / self.size), np.ones(n)]
+            )
+
+        order = np.argsort(points, axis=0)
+        points = np.take_along_axis(points, order, axis=0)
+        weights = weights[order]
+
+        self.weight += n
+
+        cdf = np.cumsum(weights, axis=0) - weights / 2
+        targets = (np.arange(self.size) + 0.5) / self.size * self.weight
+
+        self.points = interp_columns(targets, cdf, points)
+
+    def quantile(self, q):
+        probs = (np.arange(self.size) + 0.5) / self.size
+        cdf = np.broadcast_to(probs[:, None], self.points.shape)
+        return interp_columns(np.atleast_1d(q), cdf, self.points)
+
+    def hdi(self, prob=0.89, resolution=200):
+        """
+        Narrowest interval containing `prob` of the mass.
+        """
+        lower_probs = np.linspace(0, 1 - prob, resolution)
+        lower = self.quantile(lower_probs)
+        upper = self.quantile(lower_probs + prob)
+
+        best = np.argmin(upper - lower, axis=0)
+        columns = np.arange(lower.shape[1])
+
+        return lower[best, columns], upper[best, columns]
+
+
+class RunningMoments:
+    """
+    Running count, mean and sum of squared deviations per column.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, n, mean, m2):
+        total = self.n + n
+        delta = mean - self.mean
+
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta**2 * self.n * n / total
+        self.n = total
+
+    def update(self, values):
+        mean = values.mean(axis=0)
+        self.merge(len(values), mean, ((values - mean) ** 2).sum(axis=0))
+
+    @property
+    def var(self):
+        return self.m2 / (self.n - 1)
+
+
+def flatten(chunk, var_names):
+    """
+    Flatten the chunk to (chain, draw, parameter) and name the parameters.
+    """
+    blocks, parameters, levels = [], [], []
+
+    for var in var_names:
+        data = chunk[var]
+        extra = [dim for dim in data.dims if dim not in ("chain", "draw")]
+
+        if extra:
+            stacked = data.stack(parameter=extra)
+            blocks.append(stacked.values)
+            for label in stacked["parameter"].values:
+                label = label if isinstance(label, tuple) else (label,)
+                parameters.append(var)
+                levels.append(",".join(map(str, label)))
+        else:
+            blocks.append(data.values[:, :, None])
+            parameters.append(var)
+            levels.append("")
+
+    return np.concatenate(blocks, axis=2), parameters, levels
+
+
+def summarise_model(name, var_names=None, chunk_size=250, batch_size=50, hdi_prob=0.89):
+    """
+    Summarise the posterior of a model in a single pass over draw chunks.
+
+    Args:
+        name (str): Model name, one of MODELS.
+        var_names (list): Variables to summarise, population-level effects,
+            group-level SDs and hyperparameters by default.
+        chunk_size (int): Draws per chain read at a time, a multiple of
+            batch_size.
+        batch_size (int): Batch length for the batch means ESS.
+        hdi_prob (float): Probability mass of the HDI.
+
+    Returns:
+        pd.DataFrame: One row per parameter.
+    """
+    posterior = open_draws(name)
+
+    if var_names is None:
+        var_names = [
+            var
+            for var in posterior.data_vars
+            if var.startswith(("b_", "sd_")) or var in HYPERPARAMETERS
+        ]
+
+    n_chains, n_draws = posterior.sizes["chain"], posterior.sizes["draw"]
+
+    chains = [RunningMoments() for _ in range(n_chains)]
+    sketch = QuantileSketch()
+    positive = 0
+    batches = RunningMoments()
+    tails = [RunningMoments(), RunningMoments()]
+    thresholds = None
+
+    for start in range(0, n_draws, chunk_size):
+        chunk = posterior[var_names].isel(draw=slice(start, start + chunk_size))
+        values, parameters, levels = flatten(chunk, var_names)
+
+        n = values.shape[1]
+
+        for moments, chain_values in zip(chains, values):
+            moments.update(chain_values)
+
+        pooled = values.reshape(-1, values.shape[2])
+        sketch.update(pooled)
+        positive = positive + (pooled > 0).sum(axis=0)
+
+        # tail thresholds are fixed from the first chunk
+
+        if thresholds is None:
+            thresholds = np.quantile(pooled, [0.05, 0.95], axis=0)
+
+        # batch means over complete batches
+
+        n_batches = n // batch_size
+        if n_batches == 0:
+            continue
+
+        batched = values[:, : n_batches * batch_size].reshape(
+            n_chains, n_batches, batch_size, -1
+        )
+        batches.update(batched.mean(axis=2).reshape(-1, batched.shape[3]))
+
+        tails[0].update(
+            (batched <= thresholds[0]).mean(axis=2).reshape(-1, batched.shape[3])
+        )
+        tails[1].update(
+            (batched >= thresholds[1]).mean(axis=2).reshape(-1, batched.shape[3])
+        )
+
+    # combine chains
+
+    total = RunningMoments()
+    for moments in chains:
+        total.merge(moments.n, moments.mean, moments.m2)
+
+    sd = np.sqrt(total.var)
+
+    # ESS from the variance of batch means, capped at the number of draws
+
+    ess_bulk = np.minimum(total.n * total.var / (batch_size * batches.var), total.n)
+
+    ess_tail = []
+    for moments in tails:
+        p = moments.mean
+        ess_tail.append(
+            total.n * p * (1 - p) / (batch_size * np.maximum(moments.var, 1e-12))
+        )
+    ess_tail = np.minimum(np.minimum(*ess_tail), total.n)
+
+    # R-hat from between and within chain variances
+
+    within = np.mean([moments.var for moments in chains], axis=0)
+    between = np.var([moments.mean for moments in chains], axis=0, ddof=1)
+    n = chains[0].n
+    r_hat = np.sqrt(((n - 1) / n * within + between) / within)
+
+    lower, upper = sketch.hdi(hdi_prob)
+    p_positive = positive / total.n
+
+    hdi_label = f"{hdi_prob:.0%}"
+
+    return pd.DataFrame(
+        {
+            "Parameter": parameters,
+            "Variable": levels,
+            "Behaviour": name.title(),
+            "Model": MODELS[name],
+            "Mean": total.mean,
+            "Standard Deviation": sd,
+            f"Lower {hdi_label} HDI": lower,
+            f"Upper {hdi_label} HDI": upper,
+            "MCSE Mean": sd / np.sqrt(ess_bulk),
+            "MCSE SD": sd * np.sqrt(np.e * (1 - 1 / ess_bulk) ** (ess_bulk - 1) - 1),
+            "ESS Bulk": ess_bulk,
+            "ESS Tail": ess_tail,
+            "R Hat": r_hat,
+            "Probability of Direction": np.maximum(p_positive, 1 - p_positive),
+        }
+    )
+
+
+def summarise_parameters(models=None, path="outputs/parameter_summary.csv"):
+    """
+    Summarise all fitted models into parameter_summary.csv, read by
+    functions/summary_tables.R.
+    """
+    if models is None:
+        models = [name for name in MODELS if os.path.exists(DRAWS[name] + ".nc")]
+
+    summary = pd.concat([summarise_model(name) for name in models], ignore_index=True)
+
+    print("Parameter summary")
+    print("=====================================")
+    print(summary.head(10))
+
+    summary.to_csv(path, index=False)
+
+    return summary
+
+
+if __name__ == "__main__":
+    summarise_parameters()
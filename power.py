@@ -0,0 +1,355 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import expit, logit
+
+from resampling import PROTECTION, TREATMENTS
+
+# Simulation-based power analysis
+#
+# Synthetic deployments mirror the cleaned data: each deployment is in a
+# protected or unprotected area and has one plot per treatment, and plots
+# hold individuals of several guilds whose behaviour proportions are drawn
+# from an ordered beta distribution (zero and one inflated, as fitted by
+# ordbetareg in models/behaviour-time/model.R). Replicates are simulated
+# together and the treatment contrasts of plot means are estimated for all
+# replicates at once by least squares with deployment intercepts.
+
+# guilds left out of the fitted models (models/behaviour-time/model.R)
+
+EXCLUDED_GUILDS = ["Piscivore", "Unknown", ""]
+
+# parameters on the logit scale, see estimate_parameters
+
+PARAMETERS = {
+    "intercept": 0.0,
+    "phi": 2.0,
+    "cutpoints": (1.15, 1.9),
+    "sd_deployment": 0.3,
+    "sd_plot": 0.3,
+    "guilds": {"Invertivore": 0.6, "Herbivore": 0.4},
+    "guild_effects": {},
+}
+
+
+def estimate_parameters(response, behaviour="vigilance"):
+    """
+    Baseline parameters from the observed proportions of a behaviour.
+
+    The intercept and precision are moment estimates from the proportions
+    strictly between zero and one, and the cutpoints reproduce the observed
+    fractions of zeros and ones at the intercept. As in the fitted models,
+    Piscivores and individuals without a known guild are left out.
+    """
+    individuals = response.drop_duplicates("ind_id")
+    individuals = individuals[
+        individuals["guild"].notna() & ~individuals["guild"].isin(EXCLUDED_GUILDS)
+    ]
+    values = individuals[behaviour].dropna()
+    continuous = values[(values > 0) & (values < 1)]
+
+    mean, variance = continuous.mean(), continuous.var()
+    intercept = logit(mean)
+
+    zeros, ones = (values == 0).mean(), (values == 1).mean()
+
+    guilds = individuals["guild"].value_counts(normalize=True)
+
+    return {
+        **PARAMETERS,
+        "intercept": intercept,
+        "phi": mean * (1 - mean) / variance - 1,
+        "cutpoints": (intercept + logit(zeros), intercept + logit(1 - ones)),
+        "guilds": guilds.to_dict(),
+    }
+
+
+def design(n_deployments):
+    """
+    Plots of n_deployments deployments in each protection level.
+
+    Returns:
+        pd.DataFrame: deployment_id, protection, plot_id and treatment.
+    """
+    deployments = [
+        (f"{protection.lower()}{d + 1}", protection)
+        for protection in PROTECTION
+        for d in range(n_deployments)
+    ]
+
+    plots = pd.DataFrame(
+        [
+            (deployment, protection, f"{deployment}_{treatment}", treatment)
+            for deployment, protection in deployments
+            for treatment in TREATMENTS
+        ],
+        columns=["deployment_id", "protection", "plot_id", "treatment"],
+    )
+
+    return plots
+
+
+def ordered_beta(eta, phi, cutpoints, rng):
+    """
+    Ordered beta draws: zero below the first cutpoint, one above the second
+    and beta distributed with mean expit(eta) in between.
+    """
+    u = rng.random(eta.shape)
+    zero = u < 1 - expit(eta - cutpoints[0])
+    one = u >= 1 - expit(eta - cutpoints[1])
+
+    mu = expit(eta)
+    values = rng.beta(mu * phi, (1 - mu) * phi)
+
+    return np.where(zero, 0.0, np.where(one, 1.0, values))
+
+
+def simulate(plots, n_individuals, effects, parameters, n_replicates, rng):
+    """
+    Individuals of all replicates.
+
+    Plots hold 1 + Poisson(n_individuals - 1) individuals.
+
+    Args:
+        plots (pd.DataFrame): Plots, from design().
+        n_individuals (float): Mean number of individuals per plot.
+        effects (dict): (treatment, protection) -> effect against the
+            positive control on the logit scale.
+        parameters (dict): Baseline parameters, see PARAMETERS.
+        n_replicates (int): Number of replicates.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        dict: Arrays with one entry per individual: replicate, plot, guild
+        (positions) and value.
+    """
+    n_plots = len(plots)
+    deployments, deployment = np.unique(plots["deployment_id"], return_inverse=True)
+
+    guilds = list(parameters["guilds"])
+    shares = np.array(list(parameters["guilds"].values()))
+    guild_effects = np.array([parameters["guild_effects"].get(g, 0.0) for g in guilds])
+
+    treatment_effects = np.array(
+        [
+            effects.get((t, p), 0.0)
+            for t, p in zip(plots["treatment"], plots["protection"])
+        ]
+    )
+
+    # replicates x plots linear predictor
+    eta = (
+        parameters["intercept"]
+        + treatment_effects
+        + rng.normal(0, parameters["sd_deployment"], (n_replicates, len(deployments)))[
+            :, deployment
+        ]
+        + rng.normal(0, parameters["sd_plot"], (n_replicates, n_plots))
+    )
+
+    counts = 1 + rng.poisson(max(n_individuals - 1, 0), (n_replicates, n_plots))
+    cell = np.repeat(np.arange(n_replicates * n_plots), counts.ravel())
+    guild = rng.choice(len(guilds), size=len(cell), p=shares / shares.sum())
+
+    values = ordered_beta(
+        eta.ravel()[cell] + guild_effects[guild],
+        parameters["phi"],
+        parameters["cutpoints"],
+        rng,
+    )
+
+    return {
+        "replicate": cell // n_plots,
+        "plot": cell % n_plots,
+        "guild": guild,
+        "value": values,
+    }
+
+
+def plot_means(individuals, n_plots, n_replicates):
+    """
+    Mean value of each plot.
+
+    Returns:
+        np.ndarray: Plots x replicates.
+    """
+    cell = individuals["plot"] * n_replicates + individuals["replicate"]
+    size = n_plots * n_replicates
+
+    sums = np.bincount(cell, weights=individuals["value"], minlength=size)
+    counts = np.bincount(cell, minlength=size)
+
+    return (sums / counts).reshape(n_plots, n_replicates)
+
+
+def contrast_design(plots):
+    """
+    Plot-level design matrix with deployment intercepts and one indicator per
+    treatment and protection level. The coefficients of the indicators are
+    the contrasts of the treatments against the positive control within each
+    protection level.
+
+    Returns:
+        tuple: (design matrix, contrast names data frame)
+    """
+    deployments = pd.get_dummies(plots["deployment_id"]).to_numpy(dtype=float)
+
+    indicators, names = [], []
+    for protection in PROTECTION:
+        for treatment in TREATMENTS[1:]:
+            members = (plots["treatment"] == treatment) & (
+                plots["protection"] == protection
+            )
+            indicators.append(members.to_numpy(dtype=float))
+            names.append(
+                {"contrast": f"{treatment} - positive-control", "within": protection}
+            )
+
+    X = np.column_stack([deployments, *indicators])
+
+    return X, pd.DataFrame(names)
+
+
+def fit(y, X, n_contrasts):
+    """
+    Least squares fits of all replicates.
+
+    Args:
+        y (np.ndarray): Plots x replicates.
+        X (np.ndarray): Design matrix, contrasts in the last n_contrasts
+            columns.
+
+    Returns:
+        tuple: (estimates, t statistics, residual degrees of freedom), the
+        first two contrasts x replicates.
+    """
+    n, p = X.shape
+    XtX_inv = np.linalg.inv(X.T @ X)
+
+    beta = XtX_inv @ X.T @ y
+    residuals = y - X @ beta
+    s2 = (residuals**2).sum(axis=0) / (n - p)
+
+    se = np.sqrt(np.outer(np.diag(XtX_inv), s2))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = beta / se
+
+    return beta[-n_contrasts:], t[-n_contrasts:], n - p
+
+
+def power(n_deployments, n_individuals, effects, parameters, n_replicates, alpha, seed):
+    """
+    Power of the treatment contrasts for one design.
+
+    Returns:
+        pd.DataFrame: One row per contrast.
+    """
+    rng = np.random.default_rng(seed)
+
+    plots = design(n_deployments)
+    X, names = contrast_design(plots)
+
+    individuals = simulate(plots, n_individuals, effects, parameters, n_replicates, rng)
+    y = plot_means(individuals, len(plots), n_replicates)
+
+    estimate, t, df = fit(y, X, len(names))
+    critical = stats.t.ppf(1 - alpha / 2, df)
+
+    results = names.copy()
+    results.insert(0, "n_individuals", n_individuals)
+    results.insert(0, "n_deployments", n_deployments)
+    results["effect"] = [
+        effects.get((c.split(" - ")[0], w), 0.0)
+        for c, w in zip(names["contrast"], names["within"])
+    ]
+    results["estimate"] = estimate.mean(axis=1)
+    results["power"] = (np.abs(t) > critical).mean(axis=1)
+
+    return results
+
+
+def power_curves(
+    effects,
+    parameters=None,
+    n_deployments=(3, 5, 10, 15, 20),
+    n_individuals=(5, 10, 20),
+    n_replicates=2000,
+    alpha=0.05,
+    seed=1,
+    workers=1,
+):
+    """
+    Power of the treatment contrasts over a grid of designs.
+
+    Args:
+        effects (dict): (treatment, protection) -> effect against the
+            positive control on the logit scale, e.g.
+            {("grouper", "Protected"): 0.5}.
+        parameters (dict): Baseline parameters, e.g. from
+            estimate_parameters.
+        n_deployments (list): Deployments per protection level, at least 2.
+        n_individuals (list): Mean individuals per plot.
+        n_replicates (int): Simulated data sets per design.
+        alpha (float): Significance level of the two-sided t tests.
+        seed (int): Random seed.
+        workers (int): Number of processes, None for all cores.
+
+    Returns:
+        pd.DataFrame: One row per design and contrast, with the effect, the
+        mean estimated difference in plot means and the power.
+    """
+    parameters = PARAMETERS if parameters is None else parameters
+    workers = os.cpu_count() if workers is None else workers
+
+    grid = list(product(n_deployments, n_individuals))
+    seeds = np.random.SeedSequence(seed).spawn(len(grid))
+
+    args = [
+        (d, n, effects, parameters, n_replicates, alpha, s)
+        for (d, n), s in zip(grid, seeds)
+    ]
+
+    if workers == 1:
+        results = [power(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(power, *zip(*args)))
+
+    return pd.concat(results, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Power curves of treatment contrasts")
+    parser.add_argument("--behaviour", default="vigilance")
+    parser.add_argument(
+        "--effect",
+        type=float,
+        default=0.5,
+        help="predator effect in protected plots (logit)",
+    )
+    parser.add_argument("--replicates", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    response = pd.read_csv("outputs/data/response.csv")
+    parameters = estimate_parameters(response, args.behaviour)
+
+    effects = {
+        (treatment, "Protected"): args.effect for treatment in ["grouper", "barracuda"]
+    }
+
+    curves = power_curves(
+        effects, parameters, n_replicates=args.replicates, workers=args.workers
+    )
+
+    print("Power curves")
+    print("=====================================")
+    print(curves)
+
+    curves.to_csv(f"outputs/power_{args.behaviour}.csv", index=False)
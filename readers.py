@@ -0,0 +1,237 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+# Arrow-backed reader of the input data
+#
+# Every input file has a declared schema of normalised column names (lower
+# case, "-" replaced by "_") and types, so names are normalised and values
+# converted while parsing. Files are parsed by pyarrow into frames with
+# Arrow-backed strings, and can be loaded concurrently in background threads
+# while earlier tables are cleaned.
+
+STRING = pa.string()
+FLOAT = pa.float64()
+INT = pa.int64()
+
+SCHEMAS = {
+    "individuals": (
+        "data/individuals.csv",
+        {
+            "ind_id": STRING,
+            "species": STRING,
+            "group": STRING,
+            "size_class": STRING,
+            "remarks": STRING,
+            "coordinates": STRING,
+            "file": STRING,
+            "time_in": FLOAT,
+            "time_out": FLOAT,
+        },
+    ),
+    "observations": (
+        "data/observations.csv",
+        {"individual": STRING, "time": FLOAT, "behaviour": STRING},
+    ),
+    "predators": (
+        "data/predators.csv",
+        {
+            "index": STRING,
+            "species": STRING,
+            "size_class": STRING,
+            "time": FLOAT,
+            "remarks": STRING,
+        },
+    ),
+    "sites": (
+        "data/sites.csv",
+        {
+            "date": STRING,
+            "deployment_id": INT,
+            "location": STRING,
+            "protection": STRING,
+            "time_in": STRING,
+            "time_out": STRING,
+            "depth_avg": FLOAT,
+            "depth_max": FLOAT,
+            "visibility": INT,
+            "lat": STRING,
+            "lon": STRING,
+            "crew": STRING,
+            "remarks": STRING,
+        },
+    ),
+    "plots": (
+        "data/plots.csv",
+        {
+            "index": STRING,
+            "time": FLOAT,
+            "min_vid": FLOAT,
+            "max_vid": FLOAT,
+            "n_videos": INT,
+            "path": STRING,
+        },
+    ),
+    "samples": (
+        "data/samples.csv",
+        {
+            "plot": STRING,
+            "sample": STRING,
+            "start_time": FLOAT,
+            "video": STRING,
+            "status": STRING,
+        },
+    ),
+    "benthic_cover": (
+        "data/benthic-cover.csv",
+        {"name": STRING, "label": STRING, "category": STRING, "subcategory": STRING},
+    ),
+    "rugosity": (
+        "data/rugosity.csv",
+        {
+            "deployment_id": INT,
+            "treatment": STRING,
+            "sample": INT,
+            "measured_length_cm": INT,
+        },
+    ),
+    "behaviours": (
+        "data/behaviours.csv",
+        {"name": STRING, "type": STRING, "description": STRING},
+    ),
+    "traits": (
+        "data/traits.csv",
+        {
+            "class": STRING,
+            "order": STRING,
+            "family": STRING,
+            "genus": STRING,
+            "species": STRING,
+            "common.name": STRING,
+            "x.m.f.both.": STRING,
+            "length..cm.": FLOAT,
+            "height": FLOAT,
+            "diet": STRING,
+            "feeding.guild": STRING,
+            "habitat": STRING,
+            "water.column": STRING,
+            "reference": STRING,
+        },
+    ),
+}
+
+# missing values, as in pd.read_csv
+NA_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+# reads started by preload()
+_pending = {}
+
+
+def normalise_columns(names):
+    return [name.strip().lower().replace("-", "_") for name in names]
+
+
+def parse(name, path=None):
+    """
+    Parse an input file with its declared schema.
+    """
+    default, schema = SCHEMAS[name]
+    path = default if path is None else path
+
+    with open(path, newline="") as f:
+        header = normalise_columns(next(csv.reader(f)))
+
+    if header != list(schema):
+        raise ValueError(f"Columns of {path} do not match the {name} schema: {header}")
+
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=header, skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=schema,
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+
+    return table.to_pandas(types_mapper={STRING: pd.StringDtype("pyarrow")}.get)
+
+
+def preload(names=None, workers=None):
+    """
+    Start reading input files (all by default) in background threads.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    for name in SCHEMAS if names is None else names:
+        _pending[name] = pool.submit(parse, name)
+
+    pool.shutdown(wait=False)
+
+
+def read(name, path=None):
+    """
+    Read an input file, waiting for it if preloaded.
+
+    Args:
+        name (str): Input name, a key of SCHEMAS.
+        path (str): Read from this path instead of the default one.
+
+    Returns:
+        pd.DataFrame: Data with normalised column names.
+    """
+    if path is None and name in _pending:
+        return _pending.pop(name).result()
+
+    return parse(name, path)
+
+
+def read_all(names=None, workers=None, folder=None):
+    """
+    Read input files (all by default) concurrently.
+
+    Args:
+        names (list): Input names, keys of SCHEMAS.
+        workers (int): Number of threads.
+        folder (str): Read the files from this folder instead of data/.
+
+    Returns:
+        dict: Name -> data frame.
+    """
+    names = list(SCHEMAS if names is None else names)
+    paths = [
+        None
+        if folder is None
+        else os.path.join(folder, os.path.basename(SCHEMAS[name][0]))
+        for name in names
+    ]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = pool.map(parse, names, paths)
+
+        return dict(zip(names, frames))
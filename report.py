@@ -0,0 +1,252 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+# Figures and tables of the data summary
+#
+# Shared by the summaries.py notebook and the headless export below, which
+# runs the independent outputs concurrently across processes.
+
+# predictor histograms: column -> (bin width, kde, axis label)
+
+HISTOGRAMS = {
+    "depth_avg": (1, False, "Depth (m)"),
+    "rugosity_mean": (0.05, True, "Mean Rugosity"),
+    "rugosity_std": (0.01, True, "Variation in Rugosity"),
+    "biomass": (0.1, True, "Biomass Cover"),
+    "coral": (0.1, True, "Coral Cover"),
+    "sponge": (0.01, True, "Sponge Cover"),
+}
+
+
+def set_theme():
+    sns.set_theme(style="white", context="notebook", palette="Set1", font_scale=1.5)
+
+
+def save(path):
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        plt.savefig(path, dpi=300, bbox_inches="tight")
+
+
+## Figures
+
+# figures return their axes, the output of the summaries.py cells
+
+
+def histogram(values, binwidth, label, kde=True, path=None):
+    sns.histplot(values, binwidth=binwidth, kde=kde)
+    plt.xlabel(label)
+    save(path)
+
+    return plt.gca()
+
+
+def predictor_histogram(predictors, column, path=None):
+    binwidth, kde, label = HISTOGRAMS[column]
+    return histogram(predictors[column], binwidth, label, kde, path)
+
+
+def predictor_pairplot(predictors, path="figures/predictor_pairplot.png"):
+    sns.pairplot(
+        predictors.drop(columns=["deployment_id", "location", "plot_id", "treatment"]),
+        diag_kind="kde",
+    )
+    save(path)
+
+
+def response_pairplot(response, path="figures/response_pairplot.png"):
+    sns.pairplot(
+        response[["foraging", "vigilance", "movement", "bites"]],
+        diag_kind="kde",
+    )
+    save(path)
+
+
+def species_barplot(species, path=None):
+    plt.figure(figsize=(6, 24))
+    sns.barplot(data=species, x="abundance", y="species")
+    plt.xlabel("Abundance")
+    plt.ylabel("Species")
+    plt.yticks(fontstyle="italic")
+    save(path)
+
+    return plt.gca()
+
+
+def size_class_barplot(size_class_dist, path=None):
+    sns.barplot(data=size_class_dist, x="size_class", y="count")
+    plt.xlabel("Size class")
+    plt.ylabel("Count")
+    save(path)
+
+    return plt.gca()
+
+
+## Tables
+
+
+def species_list(response, guilds):
+    """
+    Observed species by abundance with their guild memberships.
+    """
+    species = response.groupby("species").size().reset_index(name="abundance")
+    species = species.sort_values("abundance", ascending=False)
+
+    # add guild
+
+    species = species.merge(guilds, on="species", how="left")
+
+    return species
+
+
+def species_table(species, path="outputs/species_list.csv"):
+    """
+    Write the species list and format it with functions/species_table.R.
+    """
+    species.to_csv(path, index=False)
+    subprocess.run(["Rscript", "functions/species_table.R"], check=True)
+
+
+def no_guild_species(species, path="outputs/data/no_guild_species.csv"):
+    no_guild = species[species["Unknown"] > 0][["species", "abundance"]].copy()
+    no_guild.to_csv(path, index=False)
+
+    return no_guild
+
+
+def size_class_distribution(response):
+    return response.groupby("size_class").size().reset_index(name="count")
+
+
+## Headless export
+
+
+def export_tasks(data):
+    """
+    Outputs of the notebook as (name, function, arguments), independent of
+    each other.
+    """
+    species = species_list(data["response"], data["guilds"])
+
+    # slowest first, so they do not start last
+    tasks = [
+        ("predictor_pairplot", predictor_pairplot, (data["predictors"],)),
+        ("response_pairplot", response_pairplot, (data["response"],)),
+        (
+            "species_barplot",
+            species_barplot,
+            (species, "figures/summaries/species.png"),
+        ),
+        ("species_table", species_table, (species,)),
+    ]
+
+    tasks += [
+        (
+            f"histogram_{column}",
+            predictor_histogram,
+            (data["predictors"], column, f"figures/summaries/{column}.png"),
+        )
+        for column in HISTOGRAMS
+    ]
+
+    tasks += [
+        (
+            "histogram_abundance",
+            histogram,
+            (
+                data["abundance"]["abundance"],
+                5,
+                "Abundance of individuals in plots",
+                True,
+                "figures/summaries/abundance.png",
+            ),
+        ),
+        (
+            "size_class_barplot",
+            size_class_barplot,
+            (
+                size_class_distribution(data["response"]),
+                "figures/summaries/size_class.png",
+            ),
+        ),
+        ("no_guild_species", no_guild_species, (species,)),
+    ]
+
+    return tasks
+
+
+def run_task(name, function, args):
+    """
+    Run one export task headless and time it. Failures to write an output or
+    run functions/species_table.R are reported in the status, anything else
+    is raised.
+    """
+    matplotlib.use("Agg")
+    set_theme()
+
+    start = time.perf_counter()
+    try:
+        function(*args)
+        status = "ok"
+    except (OSError, subprocess.CalledProcessError) as e:
+        status = f"failed: {e}"
+    finally:
+        plt.close("all")
+
+    return name, time.perf_counter() - start, status
+
+
+def export_report(workers=None, path="outputs/export_timings.csv"):
+    """
+    Run all notebook outputs concurrently and write per-task timings.
+    """
+    from cleaning import clean_data
+
+    start = time.perf_counter()
+
+    data = clean_data()
+    timings = [("clean_data", time.perf_counter() - start, "ok")]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_task, *task) for task in export_tasks(data)]
+
+        for future in as_completed(futures):
+            timings.append(future.result())
+
+    timings = pd.DataFrame(timings, columns=["task", "seconds", "status"])
+
+    print("\n\n")
+    print("Report export")
+    print("=====================================")
+    print(timings.to_string(index=False))
+    print(
+        f"\nWall time: {time.perf_counter() - start:.1f} s "
+        f"(sum of tasks: {timings['seconds'].sum():.1f} s)"
+    )
+
+    timings.to_csv(path, index=False)
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the data summary figures and tables"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    timings = export_report(workers=args.workers)
+
+    failed = timings.loc[timings["status"] != "ok", "task"]
+    if len(failed):
+        sys.exit(f"Failed tasks: {', '.join(failed)}")
@@ -0,0 +1,260 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Resampling inference for plot-level abundance
+#
+# Fast exploratory alternative to refitting the Bayesian models: plots are
+# resampled as index arrays (bootstrap within treatment x protection, or
+# treatment labels permuted within protection) and all contrasts of all
+# replicates are computed in one batched matrix product.
+
+TREATMENTS = ["positive-control", "negative-control", "grouper", "barracuda"]
+PROTECTION = ["Unprotected", "Protected"]
+
+
+def plot_matrix(abundance, predictors, by="guild", value="abundance"):
+    """
+    Abundance of every plot in wide format, with zeros for plots without
+    individuals of a category.
+
+    Args:
+        abundance (pd.DataFrame): Plot level abundance, e.g. from calc_abn or
+            calc_abn_size.
+        predictors (pd.DataFrame): Plot predictors with treatment and
+            protection.
+        by (str): Category column, e.g. "guild" or "size_class".
+        value (str): Abundance column, e.g. "abundance" or "n_prey".
+
+    Returns:
+        tuple: (plots x categories data frame, plot labels data frame)
+    """
+    labels = (
+        predictors[["plot_id", "treatment", "protection"]]
+        .drop_duplicates()
+        .query("treatment in @TREATMENTS")
+        .set_index("plot_id")
+    )
+
+    Y = (
+        abundance.pivot_table(index="plot_id", columns=by, values=value, aggfunc="sum")
+        .reindex(labels.index)
+        .fillna(0)
+    )
+
+    return Y, labels
+
+
+def contrasts(labels):
+    """
+    Group means matrix and contrasts between treatment x protection groups.
+
+    Contrasts are every treatment against the positive control within each
+    protection level, and protected against unprotected plots within each
+    treatment.
+
+    Returns:
+        tuple: (groups x plots averaging matrix, contrasts x groups matrix,
+        contrast names data frame)
+    """
+    groups = [(t, p) for p in PROTECTION for t in TREATMENTS]
+
+    G = np.zeros((len(groups), len(labels)))
+    for g, (treatment, protection) in enumerate(groups):
+        members = (
+            (labels["treatment"] == treatment) & (labels["protection"] == protection)
+        ).to_numpy()
+        if members.any():
+            G[g, members] = 1 / members.sum()
+
+    L, names = [], []
+
+    for protection in PROTECTION:
+        for treatment in TREATMENTS[1:]:
+            row = np.zeros(len(groups))
+            row[groups.index((treatment, protection))] = 1
+            row[groups.index(("positive-control", protection))] = -1
+            L.append(row)
+            names.append(
+                {"contrast": f"{treatment} - positive-control", "within": protection}
+            )
+
+    for treatment in TREATMENTS:
+        row = np.zeros(len(groups))
+        row[groups.index((treatment, "Protected"))] = 1
+        row[groups.index((treatment, "Unprotected"))] = -1
+        L.append(row)
+        names.append({"contrast": "Protected - Unprotected", "within": treatment})
+
+    return G, np.array(L), pd.DataFrame(names)
+
+
+def replicate_indices(strata, n_replicates, rng, replace=True):
+    """
+    Plot indices for resampled replicates.
+
+    Every plot position is refilled from its own stratum, with replacement
+    (bootstrap) or as a permutation of the stratum.
+
+    Returns:
+        np.ndarray: Indices, replicates x plots.
+    """
+    index = np.empty((n_replicates, len(strata)), dtype=np.intp)
+
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+
+        if replace:
+            index[:, members] = members[
+                rng.integers(0, len(members), size=(n_replicates, len(members)))
+            ]
+        else:
+            index[:, members] = rng.permuted(
+                np.tile(members, (n_replicates, 1)), axis=1
+            )
+
+    return index
+
+
+def resample(Y, strata, G, L, n_replicates, seed, replace=True):
+    """
+    Contrasts of resampled replicates.
+
+    Returns:
+        np.ndarray: Replicates x contrasts x categories.
+    """
+    rng = np.random.default_rng(seed)
+    index = replicate_indices(strata, n_replicates, rng, replace)
+
+    # replicates x plots x categories -> replicates x contrasts x categories
+    return np.einsum("kg,gn,rnc->rkc", L, G, Y[index], optimize=True)
+
+
+def resample_parallel(Y, strata, G, L, n_replicates, seed, replace, workers):
+    """
+    Split replicates across a process pool with independent seeds.
+    """
+    if workers == 1:
+        return resample(Y, strata, G, L, n_replicates, seed, replace)
+
+    blocks = np.array_split(np.arange(n_replicates), workers)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            resample,
+            *zip(
+                *[
+                    (Y, strata, G, L, len(block), s, replace)
+                    for block, s in zip(blocks, seeds)
+                ]
+            ),
+        )
+
+        return np.concatenate(list(results))
+
+
+def abundance_contrasts(
+    abundance,
+    predictors,
+    by="guild",
+    value="abundance",
+    n_replicates=5000,
+    ci=0.9,
+    seed=1,
+    workers=1,
+):
+    """
+    Bootstrap CIs and permutation p-values for treatment and protection
+    contrasts of plot-level mean abundance.
+
+    Bootstrap replicates resample plots within treatment x protection groups.
+    Permutation replicates shuffle treatment labels within protection levels
+    (for treatment contrasts) or protection labels within treatments (for
+    protection contrasts).
+
+    Args:
+        abundance (pd.DataFrame): Plot level abundance, e.g. from calc_abn.
+        predictors (pd.DataFrame): Plot predictors, from create_predictors.
+        by (str): Category column, e.g. "guild" or "size_class".
+        value (str): Abundance column.
+        n_replicates (int): Number of bootstrap and permutation replicates.
+        ci (float): Width of the percentile bootstrap interval.
+        seed (int): Random seed.
+        workers (int): Number of processes, None for all cores.
+
+    Returns:
+        pd.DataFrame: One row per contrast and category.
+    """
+    workers = os.cpu_count() if workers is None else workers
+
+    Y, labels = plot_matrix(abundance, predictors, by, value)
+    G, L, names = contrasts(labels)
+
+    y = Y.to_numpy()
+    estimate = L @ G @ y
+
+    groups = (labels["treatment"] + "_" + labels["protection"]).to_numpy()
+    boot = resample_parallel(y, groups, G, L, n_replicates, seed, True, workers)
+
+    # treatment contrasts permute within protection, protection contrasts
+    # within treatment
+
+    n_treatment = len(PROTECTION) * (len(TREATMENTS) - 1)
+    perm_treatment = resample_parallel(
+        y,
+        labels["protection"].to_numpy(),
+        G,
+        L[:n_treatment],
+        n_replicates,
+        seed + 1,
+        False,
+        workers,
+    )
+    perm_protection = resample_parallel(
+        y,
+        labels["treatment"].to_numpy(),
+        G,
+        L[n_treatment:],
+        n_replicates,
+        seed + 2,
+        False,
+        workers,
+    )
+    perm = np.concatenate([perm_treatment, perm_protection], axis=1)
+
+    alpha = (1 - ci) / 2
+    lower, upper = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+    p_value = (1 + (np.abs(perm) >= np.abs(estimate) - 1e-12).sum(axis=0)) / (
+        n_replicates + 1
+    )
+
+    # long format, one row per contrast and category
+
+    n_contrasts, n_categories = estimate.shape
+
+    results = names.loc[np.repeat(np.arange(n_contrasts), n_categories)].reset_index(
+        drop=True
+    )
+    results[by] = np.tile(Y.columns, n_contrasts)
+    results["estimate"] = estimate.ravel()
+    results["lower"] = lower.ravel()
+    results["upper"] = upper.ravel()
+    results["p_value"] = p_value.ravel()
+
+    return results
+
+
+if __name__ == "__main__":
+    abundance = pd.read_csv("outputs/data/abundance.csv")
+    predictors = pd.read_csv("outputs/data/predictors.csv")
+
+    results = abundance_contrasts(abundance, predictors, workers=None)
+
+    print("Abundance contrasts")
+    print("=====================================")
+    print(results)
+
+    results.to_csv("outputs/abundance_contrasts.csv", index=False)
@@ -0,0 +1,190 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from draws import DRAWS, export_draws
+
+# Model fits, launched as separate R processes
+
+FITS = {
+    "foraging": {
+        "script": "models/behaviour-time/model.R",
+        "args": ["foraging"],
+        "diagnostics": "outputs/behaviour-time/diagnostics_foraging.csv",
+    },
+    "vigilance": {
+        "script": "models/behaviour-time/model.R",
+        "args": ["vigilance"],
+        "diagnostics": "outputs/behaviour-time/diagnostics_vigilance.csv",
+    },
+    "movement": {
+        "script": "models/behaviour-time/model.R",
+        "args": ["movement"],
+        "diagnostics": "outputs/behaviour-time/diagnostics_movement.csv",
+    },
+    "bites": {
+        "script": "models/behaviour-bites/model.R",
+        "args": [],
+        "diagnostics": "outputs/behaviour-bites/diagnostics.csv",
+    },
+}
+
+
+def allocate(n_fits, cores, chains=4):
+    """
+    Split a core budget across fits.
+
+    Every fit runs `chains` chains in parallel. Left over cores are handed
+    out as threads per chain when all fits can run at once, otherwise fits
+    are queued so that at most `cores` chains run at any time. With fewer
+    cores than chains, fits run one at a time with `cores` parallel chains.
+
+    Returns:
+        tuple: (threads per chain, number of concurrent fits, parallel
+        chains per fit)
+    """
+    if cores >= n_fits * chains:
+        return cores // (n_fits * chains), n_fits, chains
+
+    if cores >= chains:
+        return 1, cores // chains, chains
+
+    return 1, 1, max(1, cores)
+
+
+def fit_model(name, chains, threads, parallel_chains=None):
+    """
+    Run a single model script and time it.
+    """
+    fit = FITS[name]
+    parallel_chains = chains if parallel_chains is None else parallel_chains
+
+    # behaviour-time takes the behaviour as first argument
+
+    args = fit["args"] + [str(chains), str(threads), str(parallel_chains)]
+
+    os.makedirs("outputs/logs", exist_ok=True)
+
+    # drop diagnostics from a previous run so a failed fit is not reported
+
+    if os.path.exists(fit["diagnostics"]):
+        os.remove(fit["diagnostics"])
+
+    start = time.perf_counter()
+
+    with open(f"outputs/logs/fit_{name}.log", "w") as log:
+        process = subprocess.run(
+            ["Rscript", fit["script"], *args],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+    wall_time = time.perf_counter() - start
+
+    if process.returncode != 0:
+        print(
+            f"{name}: failed after {wall_time:.1f} s with exit code"
+            f" {process.returncode}, see outputs/logs/fit_{name}.log"
+        )
+    else:
+        print(f"{name}: finished in {wall_time:.1f} s")
+
+        if os.path.exists(DRAWS[name] + ".csv"):
+            export_draws(name)
+
+    return {
+        "model": name,
+        "chains": chains,
+        "parallel_chains": parallel_chains,
+        "threads": threads,
+        "returncode": process.returncode,
+        "wall_time": wall_time,
+    }
+
+
+def run_models(models=None, cores=None, chains=4):
+    """
+    Fit models concurrently within a core budget and report sampling
+    throughput: minimum bulk ESS per second of sampler time (warmup and
+    sampling, summed over chains, as reported by the model scripts). Wall
+    time of the whole script, including R startup, compilation and output,
+    is kept as a separate column.
+    """
+    models = list(FITS) if models is None else models
+    cores = os.cpu_count() if cores is None else cores
+
+    threads, concurrency, parallel_chains = allocate(len(models), cores, chains)
+
+    print(f"Fitting {len(models)} models on {cores} cores")
+    print(
+        f"{concurrency} concurrent fits, {chains} chains"
+        f" ({parallel_chains} in parallel) x {threads} threads each"
+    )
+    print("=====================================")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(
+            pool.map(
+                lambda name: fit_model(name, chains, threads, parallel_chains), models
+            )
+        )
+
+    timings = pd.DataFrame(results)
+
+    # add convergence diagnostics written by the model scripts
+
+    diagnostics = []
+
+    for name in models:
+        path = FITS[name]["diagnostics"]
+
+        if os.path.exists(path):
+            df = pd.read_csv(path)
+            df["model"] = name
+            df["sampler_time"] = df["warmup_time"] + df["sampling_time"]
+            diagnostics.append(
+                df[
+                    [
+                        "model",
+                        "rhat_max",
+                        "ess_bulk_min",
+                        "ess_tail_min",
+                        "sampler_time",
+                    ]
+                ]
+            )
+
+    if diagnostics:
+        timings = timings.merge(pd.concat(diagnostics), how="left", on="model")
+        timings["ess_per_second"] = timings["ess_bulk_min"] / timings["sampler_time"]
+
+    print("\n\nFit timings")
+    print("=====================================")
+    print(timings)
+
+    timings.to_csv("outputs/fit_timings.csv", index=False)
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit behaviour models concurrently")
+    parser.add_argument("models", nargs="*", help=f"models to fit ({', '.join(FITS)})")
+    parser.add_argument("--cores", type=int, default=None, help="core budget")
+    parser.add_argument("--chains", type=int, default=4, help="chains per model")
+    args = parser.parse_args()
+
+    unknown = set(args.models) - set(FITS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+
+    timings = run_models(args.models or None, args.cores, args.chains)
+
+    failed = timings.loc[timings["returncode"] != 0, "model"]
+    if len(failed):
+        sys.exit(f"Failed fits: {', '.join(failed)}")
@@ -0,0 +1,164 @@
+import json
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Shared cleaned data for process pool workers
+#
+# The columns of the cleaned data frames are published once, to shared
+# memory or to .npy files, and described by a small picklable descriptor.
+# Workers attach to them as read-only NumPy views, so the frames are not
+# pickled into every worker. Object and string columns are stored as
+# categorical codes with their categories in the descriptor.
+
+FRAMES = ["response", "predictors", "abundance", "abundance_size", "windows"]
+
+# segments attached in this process, kept open while their views are in use
+_attached = {}
+
+
+def encode(series):
+    """
+    Numeric values of a column, and its categories for object columns.
+    """
+    if series.dtype == object or isinstance(
+        series.dtype, (pd.CategoricalDtype, pd.StringDtype)
+    ):
+        categorical = pd.Categorical(series)
+        return categorical.codes, [str(c) for c in categorical.categories]
+
+    # nullable integers, missing values as NaN
+    if isinstance(series.dtype, pd.Int64Dtype):
+        return series.to_numpy(dtype=float, na_value=np.nan), None
+
+    return series.to_numpy(), None
+
+
+class SharedData:
+    """
+    Published frames, owned by the publishing process.
+
+    Shared memory segments are freed with close(), or when used as a
+    context manager. Files under a folder are left in place.
+    """
+
+    def __init__(self, descriptor, segments=()):
+        self.descriptor = descriptor
+        self.segments = list(segments)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def publish(frames, folder=None):
+    """
+    Publish the columns of data frames.
+
+    Args:
+        frames (dict): Name -> data frame.
+        folder (str): Write memory-mapped .npy files and descriptor.json to
+            this folder instead of using shared memory.
+
+    Returns:
+        SharedData: Handle with the descriptor to pass to attach().
+    """
+    descriptor = {"frames": {}}
+    segments = []
+
+    for name, frame in frames.items():
+        columns = []
+
+        for column in frame.columns:
+            values, categories = encode(frame[column])
+            values = np.ascontiguousarray(values)
+
+            entry = {
+                "name": str(column),
+                "dtype": values.dtype.str,
+                "length": len(values),
+                "categories": categories,
+            }
+
+            if folder is not None:
+                path = os.path.join(folder, name, f"{len(columns)}.npy")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                np.save(path, values)
+                entry["path"] = path
+            else:
+                segment = shared_memory.SharedMemory(
+                    create=True, size=max(values.nbytes, 1)
+                )
+                np.ndarray(values.shape, values.dtype, buffer=segment.buf)[:] = values
+                segments.append(segment)
+                entry["shm"] = segment.name
+
+            columns.append(entry)
+
+        descriptor["frames"][name] = columns
+
+    if folder is not None:
+        with open(os.path.join(folder, "descriptor.json"), "w") as f:
+            json.dump(descriptor, f)
+
+    return SharedData(descriptor, segments)
+
+
+def attach(descriptor, names=None):
+    """
+    Reattach published frames as read-only zero-copy views.
+
+    Args:
+        descriptor (dict or str): Descriptor from publish(), or the path of
+            a descriptor.json.
+        names (list): Frames to attach, all by default.
+
+    Returns:
+        dict: Name -> data frame.
+    """
+    if isinstance(descriptor, str):
+        with open(descriptor) as f:
+            descriptor = json.load(f)
+
+    frames = {}
+
+    for name, columns in descriptor["frames"].items():
+        if names is not None and name not in names:
+            continue
+
+        data = {}
+
+        for entry in columns:
+            if "path" in entry:
+                values = np.load(entry["path"], mmap_mode="r")
+            else:
+                if entry["shm"] not in _attached:
+                    _attached[entry["shm"]] = shared_memory.SharedMemory(
+                        name=entry["shm"]
+                    )
+                buffer = _attached[entry["shm"]].buf
+                values = np.ndarray(
+                    entry["length"], np.dtype(entry["dtype"]), buffer=buffer
+                )
+                values.flags.writeable = False
+
+            if entry["categories"] is not None:
+                values = pd.Categorical.from_codes(
+                    values, categories=entry["categories"], validate=False
+                )
+
+            data[entry["name"]] = values
+
+        frames[name] = pd.DataFrame(data, copy=False)
+
+    return frames
@@ -47,7 +47,6 @@ def _():
     # import libraries
 
     import pandas as pd
-    import seaborn as sns
     import os
     import matplotlib.pyplot as plt
 
@@ -56,15 +55,14 @@ def _():
 
     # load data
     from cleaning import clean_data
+    import report
 
     data = clean_data()
 
     # set plot theme
 
-    sns.set_theme(
-        style="white", context="notebook", palette="Set1", font_scale=1.5
-    )
-    return data, plt, ro, sns
+    report.set_theme()
+    return data, plt, report, ro
 
 
 @app.cell
@@ -113,9 +111,8 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["depth_avg"], binwidth=1)
-    plt.xlabel("Depth (m)")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "depth_avg")
     return
 
 
@@ -126,9 +123,8 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["rugosity_mean"], binwidth=0.05, kde=True)
-    plt.xlabel("Mean Rugosity")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "rugosity_mean")
     return
 
 
@@ -139,9 +135,8 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["rugosity_std"], binwidth=0.01, kde=True)
-    plt.xlabel("Variation in Rugosity")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "rugosity_std")
     return
 
 
@@ -152,9 +147,8 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["biomass"], binwidth=0.1, kde=True)
-    plt.xlabel("Biomass Cover")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "biomass")
     return
 
 
@@ -165,9 +159,8 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["coral"], binwidth=0.1, kde=True)
-    plt.xlabel("Coral Cover")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "coral")
     return
 
 
@@ -178,22 +171,14 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["predictors"]["sponge"], binwidth=0.01, kde=True)
-    plt.xlabel("Sponge Cover")
+def _(data, report):
+    report.predictor_histogram(data["predictors"], "sponge")
     return
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.pairplot(
-        data["predictors"].drop(
-            columns=["deployment_id", "location", "plot_id", "treatment"]
-        ),
-        diag_kind="kde",
-    )
-
-    plt.savefig("figures/predictor_pairplot.png", dpi=300, bbox_inches="tight")
+def _(data, plt, report):
+    report.predictor_pairplot(data["predictors"])
 
     plt.show()
     return
@@ -218,9 +203,10 @@ def _(data, mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.histplot(data["abundance"]["abundance"], binwidth=5, kde=True)
-    plt.xlabel("Abundance of individuals in plots")
+def _(data, report):
+    report.histogram(
+        data["abundance"]["abundance"], 5, "Abundance of individuals in plots"
+    )
     return
 
 
@@ -231,20 +217,8 @@ def _(mo):
 
 
 @app.cell
-def _(data, mo, ro):
-    species = (
-        data["response"].groupby("species").size().reset_index(name="abundance")
-    )
-
-    species = species.sort_values("abundance", ascending=False)
-
-    # add guild
-
-    species = species.merge(
-        data["guilds"],
-        on="species",
-        how="left",
-    )
+def _(data, mo, report, ro):
+    species = report.species_list(data["response"], data["guilds"])
 
     species.to_csv("outputs/species_list.csv", index=False)
     ro.r(
@@ -263,42 +237,24 @@ def _(species):
 
 
 @app.cell
-def _(plt, sns, species):
-    plt.figure(figsize=(6, 24))
-    sns.barplot(data=species, x="abundance", y="species")
-    plt.xlabel("Abundance")
-    plt.ylabel("Species")
-    plt.yticks(fontstyle="italic")
+def _(plt, report, species):
+    report.species_barplot(species)
     plt.show()
     return
 
 
 @app.cell
-def _(mo, species):
-    no_guild = species[species["Unknown"] > 0][["species", "abundance"]].copy()
-
-    no_guild.to_csv("outputs/data/no_guild_species.csv", index=False)
+def _(mo, report, species):
+    no_guild = report.no_guild_species(species)
 
     mo.md(f"Number of species without guild: {len(no_guild)}")
     return
 
 
 @app.cell
-def _(data, species):
-    guilds = species.melt(
-        id_vars=["species", "abundance"],
-        value_vars=data["guilds"].columns[1:],
-        var_name="guild",
-        value_name="value",
-    )
-
-    guilds = guilds[guilds["value"] > 0]
-
-    guilds = (
-        guilds.groupby("guild")
-        .agg({"abundance": "sum"})
-        .reset_index()
-        .sort_values("abundance", ascending=False)
+def _(data):
+    guilds = data["guild_summary"][["guild", "abundance"]].sort_values(
+        "abundance", ascending=False
     )
 
     guilds
@@ -306,21 +262,9 @@ def _(data, species):
 
 
 @app.cell
-def _(data, species):
-    guilds_spp = species.melt(
-        id_vars=["species", "abundance"],
-        value_vars=data["guilds"].columns[1:],
-        var_name="guild",
-        value_name="value",
-    )
-
-    guilds_spp = guilds_spp[guilds_spp["value"] > 0]
-
-    guilds_spp = (
-        guilds_spp.groupby("guild")
-        .agg({"species": "count"})
-        .reset_index()
-        .sort_values("species", ascending=False)
+def _(data):
+    guilds_spp = data["guild_summary"][["guild", "species"]].sort_values(
+        "species", ascending=False
     )
 
     guilds_spp
@@ -328,20 +272,16 @@ def _(data, species):
 
 
 @app.cell
-def _(data, mo):
-    size_class_dist = (
-        data["response"].groupby("size_class").size().reset_index(name="count")
-    )
+def _(data, mo, report):
+    size_class_dist = report.size_class_distribution(data["response"])
 
     mo.md("Distribution of individuals by size class")
     return (size_class_dist,)
 
 
 @app.cell
-def _(plt, size_class_dist, sns):
-    sns.barplot(data=size_class_dist, x="size_class", y="count")
-    plt.xlabel("Size class")
-    plt.ylabel("Count")
+def _(report, size_class_dist):
+    report.size_class_barplot(size_class_dist)
     return
 
 
@@ -352,13 +292,8 @@ def _(mo):
 
 
 @app.cell
-def _(data, plt, sns):
-    sns.pairplot(
-        data["response"][["foraging", "vigilance", "movement", "bites"]],
-        diag_kind="kde",
-    )
-
-    plt.savefig("figures/response_pairplot.png", dpi=300, bbox_inches="tight")
+def _(data, plt, report):
+    report.response_pairplot(data["response"])
 
     plt.show()
     return
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+import readers
+
+# Taxonomy registry
+#
+# The trait table is loaded once and species names are normalised (surrounding
+# and repeated whitespace, case) into a hash index of exact names. Names that
+# miss the index, e.g. typos, fall back to a trigram index: candidates sharing
+# the most trigrams are checked by edit distance. All names of a table are
+# resolved in one batched lookup of their unique values.
+
+TRAITS = {
+    "family": "family",
+    "genus": "genus",
+    "species": "species",
+    "feeding.guild": "guild",
+}
+
+
+def normalise(names):
+    """
+    Lookup keys of names: stripped, single spaced and lower case.
+    """
+    names = pd.Series(names, dtype=object).astype("string")
+    return names.str.strip().str.replace(r"\s+", " ", regex=True).str.lower()
+
+
+def binomial(genus, species):
+    """
+    Canonical "Genus species" names.
+    """
+    genus = genus.fillna("").astype(str).str.strip().str.capitalize()
+    species = species.fillna("").astype(str).str.strip().str.lower()
+    return (genus + " " + species).str.strip().str.replace(r"\s+", " ", regex=True)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """
+    Levenshtein distance between two strings.
+    """
+    previous = list(range(len(b) + 1))
+
+    for i, x in enumerate(a, start=1):
+        current = [i]
+        for j, y in enumerate(b, start=1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            )
+        previous = current
+
+    return previous[-1]
+
+
+class Taxonomy:
+    """
+    Indexed species names of the trait table.
+
+    Args:
+        traits (pd.DataFrame): Trait records with family, genus, species
+            (canonical binomial) and guild columns.
+        synonyms (dict): Synonym -> accepted name, resolved exactly.
+    """
+
+    def __init__(self, traits, synonyms=None):
+        self.traits = traits
+
+        # one record per species for lookups
+        self.species = traits.drop_duplicates("species").reset_index(drop=True)
+
+        keys = normalise(self.species["species"])
+        targets = np.arange(len(keys))
+
+        if synonyms:
+            accepted = pd.Index(keys).get_indexer(normalise(list(synonyms.values())))
+            keys = pd.concat([keys, normalise(list(synonyms.keys()))[accepted >= 0]])
+            targets = np.concatenate([targets, accepted[accepted >= 0]])
+
+        # exact index
+        self.index = pd.Index(keys.to_numpy(dtype=object))
+        self.targets = targets
+
+        # trigram index, postings of key positions
+        postings = {}
+        self.sizes = np.zeros(len(self.index), dtype=int)
+
+        for position, key in enumerate(self.index):
+            grams = trigrams(key)
+            self.sizes[position] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+
+        self.postings = {gram: np.array(p) for gram, p in postings.items()}
+
+    @classmethod
+    def load(cls, path=None, synonyms=None):
+        traits = readers.read("traits", path)[list(TRAITS)].rename(columns=TRAITS)
+
+        traits["family"] = traits["family"].str.strip()
+        traits["species"] = binomial(traits["genus"], traits["species"])
+        traits["genus"] = traits["genus"].str.strip().str.capitalize()
+
+        return cls(traits, synonyms)
+
+    def fuzzy(self, key, max_distance=2, candidates=5):
+        """
+        Position of the closest name within max_distance edits, or -1 if
+        there is none or the closest names tie.
+        """
+        grams = [self.postings[g] for g in trigrams(key) if g in self.postings]
+        if not grams:
+            return -1
+
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.index))
+        similarity = 2 * shared / (self.sizes + len(trigrams(key)))
+        best = np.argsort(-similarity, kind="stable")[:candidates]
+        best = best[shared[best] > 0]
+
+        distances = np.array([edit_distance(key, self.index[b]) for b in best])
+        if len(distances) == 0 or distances.min() > max_distance:
+            return -1
+
+        closest = best[distances == distances.min()]
+        if len(np.unique(self.targets[closest])) > 1:
+            return -1
+
+        return closest[0]
+
+    def resolve(self, names, max_distance=2):
+        """
+        Canonical names of species, NaN where unresolved.
+
+        Args:
+            names (pd.Series): Species names.
+            max_distance (int): Edits allowed for names missing the exact
+                index, 0 for exact matches only.
+
+        Returns:
+            pd.Series: Canonical names, aligned with names.
+        """
+        codes, unique = pd.factorize(normalise(names))
+
+        positions = self.index.get_indexer(unique)
+
+        if max_distance > 0:
+            for i in np.flatnonzero(positions < 0):
+                if unique[i]:
+                    positions[i] = self.fuzzy(unique[i], max_distance)
+
+        found = positions >= 0
+        canonical = np.full(len(unique), np.nan, dtype=object)
+        canonical[found] = self.species["species"].to_numpy()[
+            self.targets[positions[found]]
+        ]
+
+        resolved = np.where(codes >= 0, canonical[codes], np.nan)
+
+        return pd.Series(resolved, index=getattr(names, "index", None), dtype=object)
+
+    def families(self):
+        """
+        Family of each species.
+        """
+        return self.species[["family", "species"]].copy()
@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import cleaning  # noqa: E402
+from taxonomy import Taxonomy  # noqa: E402
+
+
+def individuals(coordinates):
+    """
+    Minimal individual level data with the given bounding boxes
+    """
+    n = len(coordinates)
+    return pd.DataFrame(
+        {
+            "ind_id": [f"D1_P1_S1_{i}" for i in range(n)],
+            "file": "video.mp4",
+            "species": "Scarus ghobban",
+            "group": "no",
+            "time_in": np.arange(n) * 1000,
+            "time_out": np.arange(n) * 1000 + 5000,
+            "coordinates": pd.Series(coordinates, dtype="string"),
+        }
+    )
+
+
+class TestBoxes(unittest.TestCase):
+    def test_all_missing(self):
+        result = cleaning.clean_individuals(individuals([None, None, None]))
+
+        for column in ["x_min", "y_min", "x_max", "y_max", *cleaning.SPATIAL]:
+            self.assertTrue(result[column].isna().all(), column)
+
+    def test_malformed(self):
+        result = cleaning.clean_individuals(
+            individuals(["10, 20, 30, 40", "1, 2, 3, 4, 5", "1, 2", None])
+        )
+
+        self.assertEqual(
+            result.loc[0, ["x_min", "y_min", "x_max", "y_max"]].tolist(),
+            [10, 20, 30, 40],
+        )
+        self.assertTrue(result.loc[1:, "x_min"].isna().all())
+        self.assertEqual(result.loc[0, "n_neighbours"], 0)
+        self.assertTrue(result.loc[1:, "n_neighbours"].isna().all())
+
+
+class TestCopresence(unittest.TestCase):
+    def test_resolved_conspecifics(self):
+        taxonomy = Taxonomy(
+            pd.DataFrame({"species": ["Scarus ghobban"], "family": ["Scaridae"]})
+        )
+        raw = individuals(["10, 20, 30, 40", "50, 60, 70, 80"])
+        raw["species"] = ["Scarus ghobban", " scarus  GHOBBAN"]
+
+        result = cleaning.clean_individuals(raw, taxonomy)
+
+        self.assertEqual(result["species"].nunique(), 1)
+        self.assertEqual(result["n_conspecifics"].tolist(), [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()